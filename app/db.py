@@ -1,21 +1,134 @@
+import os
+import atexit
+import pathlib
 import sqlite3
 import datetime
+import hashlib
+import threading
+from concurrent.futures import Future
 from flask import g, current_app
 
+# programmes.db content hash, recomputed only when the file's stat changes
+_dataset_version = {}
+_dataset_version_lock = threading.Lock()
+
+def get_dataset_version(path=None):
+    """
+    Short content hash of programmes.db. Anything derived from the reference
+    data (index, filter payload, result caches) is keyed on this value.
+    """
+    path = path or current_app.config['PROGRAMMES_DB']
+    st = os.stat(path)
+    stamp = (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    cached = _dataset_version.get(path)
+    if cached and cached[0] == stamp:
+        return cached[1]
+
+    with _dataset_version_lock:
+        cached = _dataset_version.get(path)
+        if cached and cached[0] == stamp:
+            return cached[1]
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 16), b''):
+                digest.update(chunk)
+        version = digest.hexdigest()[:16]
+        _dataset_version[path] = (stamp, version)
+        return version
+
+class ReadOnlyPool:
+    """
+    Per-worker pool of read-only connections to one version of programmes.db.
+
+    Connections open the file with `mode=ro&immutable=1` (no locking, no
+    change detection), memory-map it and keep their prepared-statement cache,
+    so requests check out a warm connection instead of re-opening the file.
+    """
+
+    def __init__(self, path, version, size=8, mmap_size=1 << 26, cached_statements=256):
+        self.path = path
+        self.version = version
+        self.size = size
+        self.mmap_size = mmap_size
+        self.cached_statements = cached_statements
+        self.closed = False
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            f"{pathlib.Path(self.path).resolve().as_uri()}?mode=ro&immutable=1",
+            uri=True,
+            detect_types=sqlite3.PARSE_DECLTYPES,
+            check_same_thread=False,
+            cached_statements=self.cached_statements
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+        conn.execute("PRAGMA query_only = 1")
+        return conn
+
+    def acquire(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        return self._connect()
+
+    def release(self, conn):
+        with self._lock:
+            if not self.closed and len(self._idle) < self.size:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def close(self):
+        with self._lock:
+            self.closed = True
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+_programmes_pools = {}
+_programmes_pools_lock = threading.Lock()
+
+def get_programmes_pool():
+    """Pool for the current programmes.db version; a new file gets a new pool."""
+    path = current_app.config['PROGRAMMES_DB']
+    version = get_dataset_version(path)
+    pool = _programmes_pools.get(path)
+    if pool is None or pool.version != version:
+        with _programmes_pools_lock:
+            pool = _programmes_pools.get(path)
+            if pool is None or pool.version != version:
+                if pool is not None:
+                    # Checked-out connections are closed when they come back
+                    pool.close()
+                config = current_app.config
+                pool = ReadOnlyPool(
+                    path, version,
+                    size=config['PROGRAMMES_POOL_SIZE'],
+                    mmap_size=config['PROGRAMMES_MMAP_SIZE']
+                )
+                _programmes_pools[path] = pool
+    return pool
+
 def get_programmes_db():
     if 'programmes_db' not in g:
-        g.programmes_db = sqlite3.connect(
-            current_app.config['PROGRAMMES_DB'],
-            detect_types=sqlite3.PARSE_DECLTYPES
-        )
-        g.programmes_db.row_factory = sqlite3.Row
+        pool = get_programmes_pool()
+        g.programmes_pool = pool
+        g.programmes_db = pool.acquire()
     return g.programmes_db
 
 def get_users_db():
     if 'users_db' not in g:
+        ensure_users_schema()
+        # Read connection. Writes go through get_users_writer(); in WAL mode
+        # readers see the last commit and never block on the writer.
         g.users_db = sqlite3.connect(
             current_app.config['USERS_DB'],
-            detect_types=sqlite3.PARSE_DECLTYPES
+            detect_types=sqlite3.PARSE_DECLTYPES,
+            timeout=current_app.config['USERS_BUSY_TIMEOUT'] / 1000
         )
         g.users_db.row_factory = sqlite3.Row
     return g.users_db
@@ -23,14 +136,38 @@ def get_users_db():
 def close_db(e=None):
     programmes_db = g.pop('programmes_db', None)
     if programmes_db is not None:
-        programmes_db.close()
+        # Back to the pool (closed instead if the dataset changed meanwhile)
+        g.pop('programmes_pool').release(programmes_db)
 
     users_db = g.pop('users_db', None)
     if users_db is not None:
         users_db.close()
 
-def init_users_db():
-    db = get_users_db()
+# users.db schema revision, kept in PRAGMA user_version. Bump it with any
+# change below so existing files pick the change up.
+USERS_SCHEMA_VERSION = 1
+
+def migrate_users_db(path):
+    """
+    Create or upgrade the users.db schema at `path`. Returns False without
+    touching anything when the file is already at USERS_SCHEMA_VERSION.
+    Run once per deploy (`flask migrate-users-db`); with USERS_DB_AUTO_MIGRATE
+    it also runs on a process's first use of users.db, never at app startup.
+    """
+    db = sqlite3.connect(path)
+    try:
+        if db.execute("PRAGMA user_version").fetchone()[0] >= USERS_SCHEMA_VERSION:
+            return False
+        _create_users_schema(db)
+        db.execute(f"PRAGMA user_version = {USERS_SCHEMA_VERSION}")
+        db.commit()
+        return True
+    finally:
+        db.close()
+
+def _create_users_schema(db):
+    # WAL is persistent on the file: readers stop blocking behind writers
+    db.execute("PRAGMA journal_mode = WAL")
     cursor = db.cursor()
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS sessions (
@@ -50,10 +187,189 @@ def init_users_db():
             amount INTEGER DEFAULT 50,
             status TEXT DEFAULT 'PENDING',
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            rev INTEGER NOT NULL DEFAULT 0,
             FOREIGN KEY(user_uuid) REFERENCES sessions(uuid)
         )
     ''')
-    db.commit()
+
+    # Older databases predate the change counter
+    columns = {r[1] for r in cursor.execute("PRAGMA table_info(transactions)")}
+    if 'rev' not in columns:
+        cursor.execute("ALTER TABLE transactions ADD COLUMN rev INTEGER NOT NULL DEFAULT 0")
+        cursor.execute("UPDATE transactions SET rev = id")
+
+    # Admin feed: keyset pages on (created_at, id), lookups by user/status, deltas by rev
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_transactions_created ON transactions(created_at, id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_transactions_user ON transactions(user_uuid)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_transactions_status ON transactions(status)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_transactions_rev ON transactions(rev)")
+
+    # Every insert or status change takes the next revision number
+    for event in ('INSERT', 'UPDATE OF status'):
+        name = 'trg_transactions_rev_' + event.split()[0].lower()
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {name} AFTER {event} ON transactions
+            BEGIN
+                UPDATE transactions
+                SET rev = (SELECT COALESCE(MAX(rev), 0) + 1 FROM transactions)
+                WHERE id = NEW.id;
+            END
+        ''')
+
+# Paths checked (and migrated if needed) by this process
+_users_schema_ready = set()
+_users_schema_lock = threading.Lock()
+
+def ensure_users_schema():
+    """migrate_users_db() for the configured users.db, at most once per process."""
+    config = current_app.config
+    path = config['USERS_DB']
+    if path in _users_schema_ready or not config['USERS_DB_AUTO_MIGRATE']:
+        return
+    with _users_schema_lock:
+        if path not in _users_schema_ready:
+            migrate_users_db(path)
+            _users_schema_ready.add(path)
+
+
+class UsersDBWriter:
+    """
+    The single writer for users.db.
+
+    Every write (a SQL statement or a callable taking the connection) is
+    queued to one background thread. The thread drains whatever has queued up
+    while the previous commit was in flight and applies it in one transaction
+    (group commit), each job inside its own SAVEPOINT so one failure doesn't
+    sink the rest. With users.db in WAL mode, readers never wait on it.
+
+    `submit()` returns a Future (write-behind); `execute()` waits for the
+    commit and returns the job's result or raises its exception.
+    If the thread can't open users.db, everything queued fails with that
+    error and the next submit starts a fresh thread.
+    """
+
+    def __init__(self, path, batch_size=500, busy_timeout=5000):
+        self.path = path
+        self.batch_size = batch_size
+        self.busy_timeout = busy_timeout
+        # A job can wait out the batch ahead of it, then its own: each is bounded by busy_timeout
+        self.timeout = 2 * busy_timeout / 1000
+        self._queue = []
+        self._submitted = 0
+        self._committed = 0
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def submit(self, job, params=()):
+        future = Future()
+        with self._cond:
+            self._queue.append((job, params, future))
+            self._submitted += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='users-db-writer', daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+        return future
+
+    def execute(self, job, params=(), timeout=None):
+        """Submit and wait; raises TimeoutError if the writer is stuck past `timeout` (s)."""
+        return self.submit(job, params).result(self.timeout if timeout is None else timeout)
+
+    def flush(self, timeout=5.0):
+        """Block until everything submitted so far is committed."""
+        with self._cond:
+            target = self._submitted
+            return self._cond.wait_for(lambda: self._committed >= target, timeout)
+
+    def _connect(self):
+        # Autocommit mode: transactions are managed explicitly in _apply()
+        conn = sqlite3.connect(self.path, detect_types=sqlite3.PARSE_DECLTYPES, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout)}")
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        return conn
+
+    def _apply(self, conn, batch):
+        outcomes = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for job, params, future in batch:
+                conn.execute("SAVEPOINT job")
+                try:
+                    result = job(conn) if callable(job) else conn.execute(job, params).rowcount
+                    conn.execute("RELEASE job")
+                    outcomes.append((future, result, None))
+                except Exception as e:
+                    conn.execute("ROLLBACK TO job")
+                    conn.execute("RELEASE job")
+                    outcomes.append((future, None, e))
+            conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            # BEGIN/COMMIT itself failed: nothing in the batch was written
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            outcomes = [(future, None, e) for _, _, future in batch]
+        return outcomes
+
+    def _run(self):
+        try:
+            conn = self._connect()
+        except Exception as e:
+            # Fail what's queued instead of leaving callers blocked on a dead thread;
+            # clearing _thread lets the next submit() try again
+            with self._cond:
+                batch, self._queue = self._queue, []
+                self._thread = None
+                self._committed += len(batch)
+                self._cond.notify_all()
+            for _, _, future in batch:
+                future.set_exception(e)
+            return
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._queue)
+                batch = self._queue[:self.batch_size]
+                del self._queue[:self.batch_size]
+
+            # Futures resolve only after COMMIT, so callers see durable writes
+            for future, result, error in self._apply(conn, batch):
+                if error is None:
+                    future.set_result(result)
+                else:
+                    future.set_exception(error)
+
+            with self._cond:
+                self._committed += len(batch)
+                self._cond.notify_all()
+
+_users_writer_lock = threading.Lock()
+
+def get_users_writer():
+    app = current_app._get_current_object()
+    writer = app.extensions.get('users_writer')
+    if writer is None:
+        ensure_users_schema()
+        # Two writers for one file would reorder a caller's jobs (an update before its insert)
+        with _users_writer_lock:
+            writer = app.extensions.get('users_writer')
+            if writer is None:
+                writer = UsersDBWriter(
+                    app.config['USERS_DB'],
+                    batch_size=app.config['USERS_WRITE_BATCH'],
+                    busy_timeout=app.config['USERS_BUSY_TIMEOUT']
+                )
+                app.extensions['users_writer'] = writer
+                # Don't lose write-behind jobs on a clean shutdown
+                atexit.register(writer.flush)
+    return writer
 
 def init_app(app):
     app.teardown_appcontext(close_db)
+
+    @app.cli.command('migrate-users-db')
+    def migrate_users_db_command():
+        """Create or upgrade the users.db schema (run once per deploy)."""
+        path = app.config['USERS_DB']
+        changed = migrate_users_db(path)
+        print(f"{path}: {'migrated to' if changed else 'already at'} schema version {USERS_SCHEMA_VERSION}")
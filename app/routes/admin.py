@@ -1,6 +1,11 @@
-from flask import Blueprint, render_template, request, jsonify, flash, redirect, url_for, g, current_app
-from app.db import get_users_db
-import datetime
+from flask import Blueprint, render_template, request, jsonify, flash, redirect, url_for, g, current_app, make_response, Response, stream_with_context
+from app.db import get_users_writer
+from app.services.cache import cache_stats
+from app.services.auth_service import invalidate_session
+from app.services.transaction_service import list_transactions, transactions_since, SINCE_PAGE, latest_rev, publish_change, feed_event, apply_transaction_action, TRANSACTION_ACTIONS
+from app.services.events import admin_events
+import json
+import queue
 
 bp = Blueprint('admin', __name__, url_prefix='/admin')
 
@@ -12,76 +17,171 @@ def dashboard():
     if not is_admin():
         return "Access Denied. Please provide the correct key.", 403
         
-    db = get_users_db()
-    # Fetch Pending Transactions
-    transactions = db.execute('''
-        SELECT t.*, s.phone 
-        FROM transactions t
-        JOIN sessions s ON t.user_uuid = s.uuid
-        ORDER BY t.created_at DESC
-    ''').fetchall()
+    # First page only; older pages and live changes come from /dashboard/rows
+    transactions, next_cursor = list_transactions(limit=current_app.config['ADMIN_PAGE_SIZE'])
     
-    return render_template('admin/dashboard.html', transactions=transactions, key=ADMIN_KEY)
+    return render_template(
+        'admin/dashboard.html',
+        transactions=transactions,
+        next_cursor=next_cursor,
+        last_rev=latest_rev(),
+        key=request.args.get('key')
+    )
 
 @bp.route('/dashboard/rows')
 def dashboard_rows():
+    """
+    Transaction rows as HTML.
+    ?before=<cursor>  next (older) page of the keyset feed
+    ?since=<rev>      delta mode: only rows inserted/changed after that revision
+    Cursors for the following call come back in X-Next-Cursor / X-Last-Rev.
+    """
     if not is_admin():
         return "Access Denied", 403
-        
-    db = get_users_db()
-    transactions = db.execute('''
-        SELECT t.*, s.phone 
-        FROM transactions t
-        JOIN sessions s ON t.user_uuid = s.uuid
-        ORDER BY t.created_at DESC
-    ''').fetchall()
-    
-    return render_template('admin/transactions_rows.html', transactions=transactions)
 
-@bp.route('/revoke/<int:transaction_id>', methods=['POST'])
-def revoke(transaction_id):
-    db = get_users_db()
-    
-    # 1. Get Transaction
-    trx = db.execute("SELECT * FROM transactions WHERE id = ?", (transaction_id,)).fetchone()
-    if not trx:
+    since = request.args.get('since', type=int)
+    if since is not None:
+        transactions = transactions_since(since)
+        last_rev = max((t['rev'] for t in transactions), default=since)
+        response = make_response(render_template('admin/transactions_rows.html', transactions=transactions, delta=True))
+        response.headers['X-Last-Rev'] = str(last_rev)
+        return response
+
+    transactions, next_cursor = list_transactions(
+        before=request.args.get('before'),
+        limit=current_app.config['ADMIN_PAGE_SIZE']
+    )
+    response = make_response(render_template('admin/transactions_rows.html', transactions=transactions))
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
+
+@bp.route('/dashboard/stream')
+def dashboard_stream():
+    """
+    Server-Sent Events: pushes transaction inserts and status changes as they
+    happen (rendered row HTML included), so an open dashboard never polls.
+    A reconnecting browser sends Last-Event-ID (a rev) and gets what it missed;
+    the first connect passes ?since=<rev the page was rendered at> for the same.
+    """
+    if not is_admin():
+        return "Access Denied", 403
+
+    # Replay from here (the only DB reads this endpoint makes)
+    last_rev = request.headers.get('Last-Event-ID', type=int)
+    if last_rev is None:
+        last_rev = request.args.get('since', type=int)
+    keepalive = current_app.config['ADMIN_STREAM_KEEPALIVE']
+
+    def sse(event, data):
+        return f"event: {event}\nid: {data['rev']}\ndata: {json.dumps(data)}\n\n"
+
+    def stream():
+        # Subscribe before reading the backlog, so a change committed in between
+        # is queued rather than lost
+        subscription = admin_events.subscribe()
+        try:
+            # Sent straight away: stream_with_context primes the generator, and the
+            # browser's reconnect delay is the first thing it should learn anyway
+            yield "retry: 3000\n\n"
+            replayed = last_rev
+            if last_rev is not None:
+                # Page through however far behind the client is
+                while True:
+                    rows = transactions_since(replayed)
+                    for row in rows:
+                        yield sse('transaction', feed_event(row))
+                    if rows:
+                        replayed = rows[-1]['rev']
+                    if len(rows) < SINCE_PAGE:
+                        break
+            while True:
+                try:
+                    event, data = subscription.get(timeout=keepalive)
+                except queue.Empty:
+                    # Comment line keeps proxies from closing an idle connection
+                    yield ": keepalive\n\n"
+                    continue
+                # Already sent by the replay
+                if replayed is not None and data['rev'] <= replayed:
+                    continue
+                yield sse(event, data)
+        finally:
+            admin_events.unsubscribe(subscription)
+
+    response = Response(stream_with_context(stream()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+def _run_action(action, ids):
+    """
+    Apply an action as one job on the users.db writer (committed before it
+    returns), then refresh caches and live dashboards for what changed.
+    """
+    outcomes, rows = get_users_writer().execute(lambda db: apply_transaction_action(db, action, ids))
+    for row in rows:
+        invalidate_session(row['user_uuid'])
+        publish_change(row)
+    return outcomes
+
+def _single_action(action, transaction_id):
+    if _run_action(action, [transaction_id])[transaction_id] != 'ok':
         return jsonify({'success': False, 'message': 'Transaction not found'})
-    
-    user_uuid = trx['user_uuid']
-    
-    # 2. Update Transaction Status
-    db.execute("UPDATE transactions SET status = 'REVOKED' WHERE id = ?", (transaction_id,))
-    
-    # 3. Downgrade User Session
-    db.execute("UPDATE sessions SET tier = 'basic', status = 'PENDING', expiry = NULL WHERE uuid = ?", (user_uuid,))
-    
-    db.commit()
     return jsonify({'success': True})
 
+@bp.route('/revoke/<int:transaction_id>', methods=['POST'])
+def revoke(transaction_id):
+    # Transaction -> REVOKED, user session downgraded
+    if not is_admin():
+        return "Access Denied", 403
+    return _single_action('revoke', transaction_id)
+
 @bp.route('/approve/<int:transaction_id>', methods=['POST'])
 def approve(transaction_id):
-    db = get_users_db()
-    
-    # 1. Get Transaction
-    trx = db.execute("SELECT * FROM transactions WHERE id = ?", (transaction_id,)).fetchone()
-    if not trx:
-        return jsonify({'success': False, 'message': 'Transaction not found'})
-        
-    user_uuid = trx['user_uuid']
-    
-    # 2. Update Transaction Status
-    db.execute("UPDATE transactions SET status = 'APPROVED' WHERE id = ?", (transaction_id,))
-    
-    # 3. Upgrade User Session
-    expiry = datetime.datetime.now() + datetime.timedelta(hours=24)
-    db.execute("UPDATE sessions SET tier = 'premium', status = 'PAID', expiry = ? WHERE uuid = ?", (expiry, user_uuid))
-    
-    db.commit()
-    return jsonify({'success': True})
+    # Transaction -> APPROVED, user session upgraded for 24h
+    if not is_admin():
+        return "Access Denied", 403
+    return _single_action('approve', transaction_id)
 
 @bp.route('/reject/<int:transaction_id>', methods=['POST'])
 def reject(transaction_id):
-    db = get_users_db()
-    db.execute("UPDATE transactions SET status = 'REJECTED' WHERE id = ?", (transaction_id,))
-    db.commit()
-    return jsonify({'success': True})
+    if not is_admin():
+        return "Access Denied", 403
+    return _single_action('reject', transaction_id)
+
+@bp.route('/batch', methods=['POST'])
+def batch():
+    """
+    Bulk approve/reject/revoke, e.g. clearing pending M-Pesa codes at results release.
+    Body: {"action": "approve", "ids": [1, 2, 3]}
+    All updates share one transaction; the response has an outcome per id.
+    """
+    if not is_admin():
+        return "Access Denied", 403
+
+    data = request.get_json(silent=True) or {}
+    action = data.get('action')
+    if action not in TRANSACTION_ACTIONS:
+        return jsonify({'success': False, 'message': f"Unknown action. Use one of: {', '.join(TRANSACTION_ACTIONS)}"}), 400
+    # Strictly a JSON list of integers: int() over a string would turn "12" into ids 1 and 2
+    ids = data.get('ids', [])
+    if not isinstance(ids, list) or not all(isinstance(i, int) and not isinstance(i, bool) for i in ids):
+        return jsonify({'success': False, 'message': 'ids must be a list of transaction ids'}), 400
+    if len(ids) > current_app.config['ADMIN_BATCH_LIMIT']:
+        return jsonify({'success': False, 'message': f"At most {current_app.config['ADMIN_BATCH_LIMIT']} ids per batch"}), 400
+
+    outcomes = _run_action(action, ids) if ids else {}
+    return jsonify({
+        'success': True,
+        'action': action,
+        'updated': sum(1 for o in outcomes.values() if o == 'ok'),
+        'results': [{'id': i, 'outcome': o} for i, o in outcomes.items()]
+    })
+
+@bp.route('/stats/cache')
+def stats_cache():
+    # Hit/miss/eviction counters for sizing the in-process caches
+    if not is_admin():
+        return "Access Denied", 403
+    return jsonify(cache_stats())
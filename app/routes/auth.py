@@ -1,36 +1,37 @@
-from flask import Blueprint, request, make_response, g, session
+from flask import Blueprint, request, make_response, g, session, current_app
 import uuid
-from app.services.auth_service import get_session, create_session
+from app.services.auth_service import get_session_backend
 
 bp = Blueprint('auth', __name__)
 
+def _session_bypassed():
+    # Static files, health checks and cacheable APIs never need a session
+    return request.endpoint in current_app.config['SESSION_BYPASS_ENDPOINTS']
+
 @bp.before_app_request
 def load_user():
-    # Attempt to read UUID from cookie
-    user_uuid = request.cookies.get('user_id')
-    
-    if user_uuid:
-        user = get_session(user_uuid)
-        if user:
-            g.user = user
-        else:
-            # Cookie exists but DB doesn't have it (maybe DB wipe). Re-create.
-            create_session(user_uuid)
-            g.user = get_session(user_uuid)
-    else:
-        g.user = None
+    g.user = None
+    if _session_bypassed():
+        return
+
+    # Backend (users.db or signed cookie) resolves the cookie to a session
+    g.user = get_session_backend().load(request)
 
 @bp.after_app_request
 def set_cookie(response):
+    if _session_bypassed():
+        return response
+
+    backend = get_session_backend()
     # If no user in g, it means they are new or cleared cookies.
     # We assign them a UUID and set the cookie.
     if g.get('user') is None:
         new_uuid = str(uuid.uuid4())
-        create_session(new_uuid)
-        g.user = get_session(new_uuid) # Set for this context just in case
-        
-        # Set cookie that lasts 1 year
-        response.set_cookie('user_id', new_uuid, max_age=60*60*24*365)
+        g.user = backend.create(new_uuid) # Set for this context just in case
+        backend.save(response, g.user)
+    elif g.get('session_dirty'):
+        # Session changed during the request (cookie backend re-signs it)
+        backend.save(response, g.user)
     
     return response
 
@@ -49,13 +50,9 @@ def show_session():
 @bp.route('/reset-session')
 def reset_session():
     """Helper route to downgrade current user back to Basic for testing."""
+    from flask import flash, redirect, url_for
     if g.user:
-        from app.db import get_users_db
-        from flask import flash, redirect, url_for
-        
-        db = get_users_db()
-        db.execute("UPDATE sessions SET tier='basic', status='PENDING', expiry=NULL WHERE uuid = ?", (g.user['uuid'],))
-        db.commit()
+        get_session_backend().update(g.user['uuid'], tier='basic', status='PENDING', expiry=None)
         
         flash("Session reset to Free/Basic for testing.", "info")
     
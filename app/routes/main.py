@@ -1,12 +1,27 @@
-from flask import Blueprint, render_template, request, g, jsonify, flash, Response
-from app.services.search_service import search, get_filter_options
+from flask import Blueprint, render_template, request, g, jsonify, flash, Response, current_app, stream_with_context
+from app.services.search_service import search, cached_search_page, get_filter_payload, suggest, SUGGEST_FIELDS, SEARCH_LIMIT, parse_search_fields, to_columns
+from app.services.export_service import export_rows, export_stream, parse_columns, EXPORT_FORMATS
+from app.services.card_service import card_fragments
+from app.services.compare_service import compare_programmes
+from app.services.evaluation_service import evaluate_students, evaluation_stream, PROGRAMME_FIELDS
+from app.db import get_dataset_version
 from app.services.auth_service import get_session
 import datetime
-import csv
-import io
+import json
 
 bp = Blueprint('main', __name__)
 
+# results_partial.html stitches cached per-programme card HTML with the user's part
+bp.add_app_template_global(card_fragments)
+
+def _cluster_map_arg():
+    # ?cluster_map= as a dict; garbled JSON or anything but an object means no map (fail silently, use defaults)
+    try:
+        cluster_map = json.loads(request.args.get('cluster_map') or '{}')
+    except ValueError:
+        return {}
+    return cluster_map if isinstance(cluster_map, dict) else {}
+
 def get_current_tier():
     # Free Pivot: All users are premium now.
     return 'premium'
@@ -15,11 +30,13 @@ def get_current_tier():
 def index():
     # Optimization: Serve skeleton page. filters loaded via AJAX.
     tier = get_current_tier()
-    return render_template('index.html', tier=tier)
+    return render_template('index.html', tier=tier, dataset_version=get_dataset_version())
 
 @bp.route('/search', methods=['GET'])
 def search_route():
     course = request.args.get('course')
+    # Free-text query (ranked matches on name / institution / cluster)
+    query = request.args.get('q', '').strip()
     # Use getlist for Multi-Select arguments
     # Note: AJAX might send them as repeated keys 'uni=A&uni=B' OR backend needs to split comma-separated if JS sends that.
     # We will assume getlist works for repeated keys, and we can also check for comma-split fallback if needed.
@@ -35,38 +52,45 @@ def search_route():
     
     # Security Rule 1 Check (Frontend feedback)
     security_warning = False
-    if not course and not institution and not cluster and not points:
+    if not course and not query and not institution and not cluster and not points:
         security_warning = True
     
     # Parse Cluster Map (JSON)
-    cluster_map_json = request.args.get('cluster_map')
-    cluster_map = {}
-    if cluster_map_json:
-        try:
-            import json
-            cluster_map = json.loads(cluster_map_json)
-        except:
-            pass # Fail silently, use defaults
+    cluster_map = _cluster_map_arg()
 
     # Determine Tier
     tier = get_current_tier()
     
-    # Perform Search
+    # Keyset pagination: ?cursor= comes from the previous page (infinite scroll)
+    cursor = request.args.get('cursor')
+    # Resolved once per render (card fragments are cached per version)
+    dataset_version = get_dataset_version()
+
+    # Perform Search (through the result cache)
     # The service will return [] if security warning is true, effectively doing the same check
-    results = search(
+    # The total is only counted for the first page
+    page = cached_search_page(
         course_name=course if course else None,
         institution=institution if institution else None,
         cluster=cluster if cluster else None,
         user_points=points,
         tier=tier,
         reach=reach,
-        cluster_map=cluster_map
+        cluster_map=cluster_map,
+        query=query or None,
+        cursor=cursor,
+        page_size=current_app.config['SEARCH_PAGE_SIZE'],
+        with_total=not cursor
     )
+    results = page.results
     
     
     # AJAX Response
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-        return render_template('results_partial.html', results=results, tier=tier, security_warning=security_warning, user_points=points)
+        return render_template(
+            'results_partial.html', results=results, tier=tier, security_warning=security_warning, user_points=points,
+            next_cursor=page.next_cursor, total=page.total, append=bool(cursor), dataset_version=dataset_version
+        )
     
     # Full Page Fallback
     # Optimization: Don't load full options into HTML. Let JS fetch them.
@@ -76,14 +100,118 @@ def search_route():
         'index.html', 
         results=results, 
         tier=tier,
-        security_warning=security_warning
+        security_warning=security_warning,
+        next_cursor=page.next_cursor,
+        total=page.total,
+        dataset_version=dataset_version
     )
 
+@bp.route('/api/search', methods=['GET'])
+def api_search():
+    """
+    /search as columnar JSON for clients that render their own cards.
+    Same query parameters as /search, plus ?fields=code,name,... and ?limit=.
+    Body: {"fields": [...], "columns": {field: [values]}, "count", "next_cursor", "total"}
+    """
+    try:
+        fields = parse_search_fields(request.args.get('fields'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    cluster_map = {}
+    if request.args.get('cluster_map'):
+        try:
+            cluster_map = json.loads(request.args['cluster_map'])
+        except ValueError:
+            return jsonify({'error': 'cluster_map must be a JSON object'}), 400
+        if not isinstance(cluster_map, dict):
+            return jsonify({'error': 'cluster_map must be a JSON object'}), 400
+
+    limit = request.args.get('limit', current_app.config['SEARCH_PAGE_SIZE'], type=int)
+    cursor = request.args.get('cursor')
+    page = cached_search_page(
+        course_name=request.args.get('course') or None,
+        institution=request.args.getlist('uni') or None,
+        cluster=request.args.getlist('cluster') or None,
+        user_points=request.args.get('points'),
+        tier=get_current_tier(),
+        reach=request.args.get('reach') == 'true',
+        cluster_map=cluster_map,
+        query=request.args.get('q', '').strip() or None,
+        cursor=cursor,
+        page_size=max(1, min(limit, SEARCH_LIMIT)),
+        with_total=not cursor
+    )
+
+    return jsonify({
+        'fields': fields,
+        'columns': to_columns(page.results, fields),
+        'count': len(page.results),
+        'next_cursor': page.next_cursor,
+        'total': page.total
+    })
+
+@bp.route('/api/compare', methods=['GET'])
+def api_compare():
+    """
+    Compare tray data for programme codes, e.g. /api/compare?codes=1111134,1263134
+    (repeated codes= also work). Optional points / cluster_map add diff + status.
+    """
+    codes = [c.strip() for value in request.args.getlist('codes') for c in value.split(',') if c.strip()]
+    if not codes:
+        return jsonify({'error': 'codes is required'}), 400
+    max_codes = current_app.config['COMPARE_MAX_CODES']
+    if len(codes) > max_codes:
+        return jsonify({'error': f"At most {max_codes} codes per call"}), 400
+
+    cluster_map = _cluster_map_arg()
+
+    return jsonify(compare_programmes(codes, request.args.get('points'), cluster_map))
+
 @bp.route('/api/filters', methods=['GET'])
 def api_filters():
-    # Cache friendly endpoint for filter options
-    options = get_filter_options()
-    return jsonify(options)
+    # Cache friendly endpoint for filter options.
+    # Body is built once per dataset version; the ETag is the programmes.db content hash,
+    # with its own value for the gzip body (a strong ETag names one exact representation).
+    payload = get_filter_payload()
+    use_gzip = payload.gzipped is not None and 'gzip' in request.accept_encodings
+    etag = f"{payload.version}-gz" if use_gzip else payload.version
+
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(payload.gzipped if use_gzip else payload.body, mimetype='application/json')
+        if use_gzip:
+            response.headers['Content-Encoding'] = 'gzip'
+
+    # Vary on the 304 too, so caches keep the two encodings apart
+    response.set_etag(etag)
+    response.vary.add('Accept-Encoding')
+    return _dataset_cache_control(response, payload.version)
+
+def _dataset_cache_control(response, version):
+    # Versioned URLs (?v=<dataset version>) never change, so browsers and CDNs can keep them forever
+    if request.args.get('v') == version:
+        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    else:
+        max_age = current_app.config['FILTERS_MAX_AGE']
+        response.headers['Cache-Control'] = f'public, max-age={max_age}, s-maxage={max_age}, stale-while-revalidate={max_age}'
+    return response
+
+@bp.route('/api/suggest', methods=['GET'])
+def api_suggest():
+    # Autocomplete for the filter pickers: /api/suggest?field=course&q=geosp
+    field = request.args.get('field', 'course')
+    if field not in SUGGEST_FIELDS:
+        return jsonify({'error': f"Unknown field. Use one of: {', '.join(SUGGEST_FIELDS)}"}), 400
+
+    config = current_app.config
+    limit = request.args.get('limit', config['SUGGEST_LIMIT'], type=int)
+    limit = max(1, min(limit, config['SUGGEST_MAX_LIMIT']))
+    query = request.args.get('q', '')
+
+    response = jsonify({'field': field, 'q': query, 'results': suggest(field, query, limit)})
+    return _dataset_cache_control(response, get_dataset_version())
 
 @bp.route('/export', methods=['GET'])
 def export_results():
@@ -94,11 +222,8 @@ def export_results():
     points = request.args.get('points')
     reach = request.args.get('reach') == 'true'
     
-    # Handle JS "comma-separated" behavior
-    if len(institution) == 1 and ',' in institution[0]:
-        institution = institution[0].split(',')
-    if len(cluster) == 1 and ',' in cluster[0]:
-        cluster = cluster[0].split(',')
+    # Lists arrive as repeated keys (uni=A&uni=B). No comma splitting:
+    # cluster and university names contain commas.
 
     # Check Tier (Implicitly handled by search_service returning hidden data for basic, 
     # but we can block export entirely for Basic if desired. 
@@ -111,33 +236,62 @@ def export_results():
     # if user_tier != 'premium':
     #     return Response("Premium Feature Only", status=403)
 
-    # Fetch Results
-    # Reuse Search Service (it now exposes full data)
-    results = search(course, institution, cluster, points, tier='premium', reach=reach)
+    # Dynamic per-cluster points, same as /search
+    cluster_map = _cluster_map_arg()
 
-    # Generate CSV
-    def generate():
-        data = io.StringIO()
-        w = csv.writer(data)
-        
-        # Header
-        w.writerow(('Programme', 'Institution', 'Code', 'Cutoff'))
-        yield data.getvalue()
-        data.seek(0)
-        data.truncate(0)
-
-        for r in results:
-            w.writerow((
-                r['name'],
-                r['institution'],
-                r['code'],
-                r['cutoff']
-            ))
-            yield data.getvalue()
-            data.seek(0)
-            data.truncate(0)
+    fmt = request.args.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        return Response(f"Unsupported format. Use one of: {', '.join(EXPORT_FORMATS)}", status=400)
+    try:
+        columns = parse_columns(request.args.get('columns'))
+    except ValueError as e:
+        return Response(str(e), status=400)
+
+    # Stream straight from a programmes.db cursor: no 100-row cap, constant memory
+    rows = export_rows(
+        course_name=course,
+        institution=institution,
+        cluster=cluster,
+        user_points=points,
+        reach=reach,
+        cluster_map=cluster_map
+    )
 
     # Streaming Response
-    response = Response(generate(), mimetype='text/csv')
-    response.headers.set("Content-Disposition", "attachment", filename="sar_shortlist.csv")
+    response = Response(stream_with_context(export_stream(rows, columns, fmt)), mimetype=EXPORT_FORMATS[fmt])
+    response.headers.set("Content-Disposition", "attachment", filename=f"sar_shortlist.{fmt}")
     return response
+
+@bp.route('/api/evaluate', methods=['POST'])
+def api_evaluate():
+    """
+    Batch Safe/Tight/Risk evaluation for a whole class.
+    Body: {"students": [{"id", "points", "cluster_map", "uni", "cluster", "reach"}, ...], "limit": 20}
+    ?format=json (default) returns everything at once; ?format=jsonl streams one student per line.
+    """
+    data = request.get_json(silent=True) or {}
+    students = data.get('students')
+    if not isinstance(students, list):
+        return jsonify({'error': 'students must be a list of profiles'}), 400
+
+    config = current_app.config
+    if len(students) > config['EVALUATE_MAX_STUDENTS']:
+        return jsonify({'error': f"At most {config['EVALUATE_MAX_STUDENTS']} students per call"}), 400
+    try:
+        limit = int(data.get('limit', config['EVALUATE_LIMIT']))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'limit must be a number'}), 400
+    limit = max(0, min(limit, config['EVALUATE_MAX_LIMIT']))
+
+    fmt = request.args.get('format', 'json')
+    if fmt == 'jsonl':
+        response = Response(stream_with_context(evaluation_stream(evaluate_students(students, limit))), mimetype='application/x-ndjson')
+        response.headers['X-Programme-Fields'] = ','.join(PROGRAMME_FIELDS)
+        return response
+    if fmt != 'json':
+        return jsonify({'error': 'Unsupported format. Use json or jsonl'}), 400
+
+    return jsonify({
+        'programme_fields': PROGRAMME_FIELDS,
+        'students': list(evaluate_students(students, limit))
+    })
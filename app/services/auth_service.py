@@ -1,31 +1,153 @@
-from app.db import get_users_db
+from flask import current_app, g
+from itsdangerous import URLSafeTimedSerializer, BadSignature
+from app.db import get_users_db, get_users_writer
+from app.services.cache import ResultCache
 import datetime
 
+# Session cookies last 1 year
+COOKIE_MAX_AGE = 60*60*24*365
+
+# Read-through cache of session rows, so a returning visitor costs no SQLite read
+_session_cache = None
+
+def get_session_cache():
+    global _session_cache
+    if _session_cache is None:
+        _session_cache = ResultCache(
+            'sessions',
+            max_weight=current_app.config['SESSION_CACHE_SIZE'],
+            ttl=current_app.config['SESSION_CACHE_TTL']
+        )
+    return _session_cache
+
+def invalidate_session(uuid):
+    """Drop a cached session after its row was updated."""
+    get_session_cache().discard(uuid)
+
 def get_session(uuid):
-    db = get_users_db()
-    return db.execute("SELECT * FROM sessions WHERE uuid = ?", (uuid,)).fetchone()
+    cache = get_session_cache()
+    user = cache.get(uuid)
+    if user is None:
+        db = get_users_db()
+        row = db.execute("SELECT * FROM sessions WHERE uuid = ?", (uuid,)).fetchone()
+        if row is None:
+            return None
+        user = dict(row)
+        cache.set(uuid, user)
+    return user
 
 def create_session(uuid, phone="Unknown"):
-    db = get_users_db()
     # Default expiry one year from now just for data cleanliness, though free tier doesn't expire really
     expiry = datetime.datetime.now() + datetime.timedelta(days=365)
-    
-    db.execute('''
+
+    # Write-behind: the INSERT is group-committed with other writes on the
+    # users.db writer thread; the request carries on with the row it would have read back.
+    get_users_writer().submit('''
         INSERT OR IGNORE INTO sessions (uuid, phone, tier, status, expiry)
         VALUES (?, ?, 'free', 'active', ?)
     ''', (uuid, phone, expiry))
-    db.commit()
-    
-    return get_session(uuid)
+
+    user = {
+        'uuid': uuid,
+        'phone': phone,
+        'tier': 'free',
+        'status': 'active',
+        'expiry': expiry,
+        'mpesa_ref': None
+    }
+    get_session_cache().set(uuid, user)
+    return user
 
 def update_tier(uuid, tier, mpesa_ref=None):
-    db = get_users_db()
     # Set expiry to 24 hours from now for 24h pass
     expiry = datetime.datetime.now() + datetime.timedelta(hours=24)
-    
-    db.execute('''
-        UPDATE sessions 
-        SET tier = ?, status = 'active', expiry = ?, mpesa_ref = ?
-        WHERE uuid = ?
-    ''', (tier, expiry, mpesa_ref, uuid))
-    db.commit()
+    get_session_backend().update(uuid, tier=tier, status='active', expiry=expiry, mpesa_ref=mpesa_ref)
+
+# --- Session Backends ---
+# SESSION_BACKEND selects where session state lives:
+#   'sqlite' - uuid cookie, row in users.db (sessions table)
+#   'cookie' - the whole session in an itsdangerous-signed cookie, zero DB I/O.
+#              Suits serverless instances whose users.db is ephemeral (/tmp on Vercel).
+
+class SQLiteSessionBackend:
+    cookie_name = 'user_id'
+
+    def load(self, request):
+        # Attempt to read UUID from cookie
+        user_uuid = request.cookies.get(self.cookie_name)
+        if not user_uuid:
+            return None
+        user = get_session(user_uuid)
+        if user is None:
+            # Cookie exists but DB doesn't have it (maybe DB wipe). Re-create.
+            user = create_session(user_uuid)
+        return user
+
+    def create(self, uuid):
+        return create_session(uuid)
+
+    def save(self, response, user):
+        response.set_cookie(self.cookie_name, user['uuid'], max_age=COOKIE_MAX_AGE)
+
+    def update(self, uuid, **fields):
+        # Queued behind any pending write-behind INSERT of the same row
+        assignments = ', '.join(f'{col} = ?' for col in fields)
+        get_users_writer().execute(f"UPDATE sessions SET {assignments} WHERE uuid = ?", (*fields.values(), uuid))
+        invalidate_session(uuid)
+
+class SignedCookieSessionBackend:
+    cookie_name = 'sar_session'
+    fields = ('uuid', 'tier', 'status', 'expiry')
+
+    def _serializer(self):
+        return URLSafeTimedSerializer(current_app.secret_key, salt='sar-session')
+
+    def load(self, request):
+        token = request.cookies.get(self.cookie_name)
+        if token:
+            try:
+                data = self._serializer().loads(token, max_age=COOKIE_MAX_AGE)
+                return {**data, 'phone': 'Unknown', 'mpesa_ref': None}
+            except BadSignature:
+                pass # Tampered or expired: issue a fresh session below
+
+        # Upgrading from the sqlite backend: keep the visitor's uuid
+        legacy_uuid = request.cookies.get(SQLiteSessionBackend.cookie_name)
+        if legacy_uuid:
+            g.session_dirty = True
+            return self.create(legacy_uuid)
+        return None
+
+    def create(self, uuid):
+        expiry = datetime.datetime.now() + datetime.timedelta(days=365)
+        return {
+            'uuid': uuid,
+            'phone': 'Unknown',
+            'tier': 'free',
+            'status': 'active',
+            'expiry': expiry.isoformat(timespec='seconds'),
+            'mpesa_ref': None
+        }
+
+    def save(self, response, user):
+        token = self._serializer().dumps({f: user[f] for f in self.fields})
+        response.set_cookie(self.cookie_name, token, max_age=COOKIE_MAX_AGE, httponly=True, samesite='Lax')
+
+    def update(self, uuid, **fields):
+        # Only the current visitor's cookie can be rewritten
+        user = g.get('user')
+        if not user or user['uuid'] != uuid:
+            return
+        for col, value in fields.items():
+            if isinstance(value, datetime.datetime):
+                value = value.isoformat(timespec='seconds')
+            user[col] = value
+        g.session_dirty = True
+
+SESSION_BACKENDS = {
+    'sqlite': SQLiteSessionBackend(),
+    'cookie': SignedCookieSessionBackend()
+}
+
+def get_session_backend():
+    return SESSION_BACKENDS[current_app.config['SESSION_BACKEND']]
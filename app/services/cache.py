@@ -0,0 +1,106 @@
+import threading
+import time
+from collections import OrderedDict
+
+# Every cache registers here so the admin stats endpoint can report on all of them
+_registry = {}
+
+class ResultCache:
+    """
+    Thread-safe LRU cache with a TTL, bounded by total entry weight.
+
+    Entries are tagged with the dataset version they were computed against;
+    the first lookup under a new version drops everything.
+    """
+
+    def __init__(self, name, max_weight=10000, ttl=600, weigher=None):
+        self.name = name
+        self.max_weight = max_weight
+        self.ttl = ttl
+        self.weigher = weigher or (lambda value: 1)
+
+        self._data = OrderedDict()  # key -> (value, weight, expires_at)
+        self._weight = 0
+        self._version = None
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+        _registry[name] = self
+
+    def _check_version(self, version):
+        if version != self._version:
+            if self._data:
+                self.invalidations += 1
+            self._data.clear()
+            self._weight = 0
+            self._version = version
+
+    def get(self, key, version=None):
+        with self._lock:
+            self._check_version(version)
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, weight, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                self._weight -= weight
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, version=None):
+        weight = self.weigher(value)
+        if weight > self.max_weight:
+            return
+        with self._lock:
+            self._check_version(version)
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._weight -= old[1]
+            self._data[key] = (value, weight, time.monotonic() + self.ttl)
+            self._weight += weight
+            while self._weight > self.max_weight:
+                _, (_, w, _) = self._data.popitem(last=False)
+                self._weight -= w
+                self.evictions += 1
+
+    def discard(self, key):
+        with self._lock:
+            entry = self._data.pop(key, None)
+            if entry is not None:
+                self._weight -= entry[1]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._weight = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._data),
+                'weight': self._weight,
+                'max_weight': self.max_weight,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+                'version': self._version
+            }
+
+def cache_stats():
+    return {name: cache.stats() for name, cache in _registry.items()}
@@ -0,0 +1,42 @@
+from flask import current_app, get_template_attribute
+from markupsafe import Markup
+from app.db import get_dataset_version
+from app.services.cache import ResultCache
+from collections import namedtuple
+
+# Result cards: everything but the diff/status parts depends only on the
+# programme, so that HTML is rendered once per dataset version and reused.
+# results_partial.html stitches the cached fragments around the user's part.
+CardFragments = namedtuple('CardFragments', 'head tail')
+
+# Result fields that depend on the user and must never reach a cached fragment
+USER_FIELDS = ('diff', 'status', 'forecast_diff', 'forecast_status')
+
+_card_cache = None
+
+def get_card_cache():
+    global _card_cache
+    if _card_cache is None:
+        config = current_app.config
+        _card_cache = ResultCache('cards', max_weight=config['CARD_CACHE_SIZE'], ttl=config['CARD_CACHE_TTL'])
+    return _card_cache
+
+def render_card(result):
+    programme = {k: v for k, v in result.items() if k not in USER_FIELDS}
+    return CardFragments(
+        Markup(get_template_attribute('_programme_card.html', 'card_head')(programme)),
+        Markup(get_template_attribute('_programme_card.html', 'card_tail')(programme))
+    )
+
+def card_fragments(result, version=None):
+    """
+    Cached (head, tail) HTML for a search result's programme.
+    Pass the dataset version when rendering many cards so it's resolved once per page.
+    """
+    cache = get_card_cache()
+    version = version or get_dataset_version()
+    card = cache.get(result['code'], version)
+    if card is None:
+        card = render_card(result)
+        cache.set(result['code'], card, version)
+    return card
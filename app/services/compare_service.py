@@ -0,0 +1,53 @@
+from app.services.programme_index import get_programme_index
+from app.services.search_service import assess, cluster_points, effective_points_for
+
+# Compare tray: many programme codes resolved in one pass over the index's
+# code map, with every programme's cutoffs aligned on the dataset's year axis.
+
+def _series(record, years):
+    # Oldest year first; None where the programme had no (valid) cutoff
+    cutoffs = record['cutoffs']
+    return [cutoffs[y] if cutoffs.get(y) and cutoffs[y] > 0 else None for y in years]
+
+def _deltas(series):
+    # Change from the previous year, None unless both years have a cutoff
+    return [None] + [
+        round(cur - prev, 3) if cur is not None and prev is not None else None
+        for prev, cur in zip(series, series[1:])
+    ]
+
+def compare_programmes(codes, user_points=None, cluster_map=None):
+    """
+    Side-by-side data for `codes` (input order, duplicates dropped).
+    Returns {'years', 'programmes', 'missing'}; each programme carries its
+    aligned 'series' and 'deltas', the forecast, and diff/status when points are given.
+    """
+    index = get_programme_index()
+    years = tuple(reversed(index.years))
+    points_by_cluster = cluster_points(cluster_map)
+    programmes, missing = [], []
+    for code in dict.fromkeys(codes):
+        pos = index.by_code.get(code)
+        if pos is None:
+            missing.append(code)
+            continue
+        record = index.records[pos]
+        series = _series(record, years)
+        cutoff = index.cutoffs[pos]
+        item = {
+            'code': record['code'],
+            'name': record['name'],
+            'institution': record['institution'],
+            'cluster': record['cluster'],
+            'cutoff': cutoff if cutoff > 0 else None,
+            'trend': record['trend'],
+            'forecast': record.get('forecast'),
+            'forecast_low': record.get('forecast_low'),
+            'forecast_high': record.get('forecast_high'),
+            'series': series,
+            'deltas': _deltas(series),
+        }
+        item.update(assess(effective_points_for(record['cluster'], user_points, points_by_cluster), cutoff))
+        programmes.append(item)
+
+    return {'years': years, 'programmes': programmes, 'missing': missing}
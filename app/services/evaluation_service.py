@@ -0,0 +1,102 @@
+from app.services.programme_index import get_programme_index, normalize
+from app.services.search_service import assess, points_window
+from itertools import islice, repeat
+import heapq
+import json
+
+# Batch placement evaluation: many student profiles against the programme
+# index in one pass (counsellors running a whole class at once).
+# Per student and cluster, the Safe/Tight/Risk split is three bisects over the
+# cluster's sorted cutoffs, and the shortlist is the same points window
+# search() uses, so the cost doesn't grow with the number of programmes.
+
+# Field order of each shortlist row
+PROGRAMME_FIELDS = ('code', 'cutoff', 'diff', 'status')
+STATUSES = ('Safe', 'Tight', 'Risk', 'Unknown')
+
+def _as_list(value):
+    if not value:
+        return []
+    return [value] if isinstance(value, str) else list(value)
+
+def _points(value):
+    if value is None or value == '':
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+def evaluate_student(index, profile, limit=20):
+    """
+    One student profile:
+        {"id": ..., "points": 38.5, "cluster_map": {cluster: points},
+         "uni": [...], "cluster": [...], "reach": false}
+    Returns {"id", "counts": {status: n}, "programmes": [[code, cutoff, diff, status], ...]}
+    or {"id", "error"} when the profile has no usable points.
+    """
+    student_id = profile.get('id')
+    points = _points(profile.get('points'))
+    cluster_map = profile.get('cluster_map') or {}
+    if not isinstance(cluster_map, dict):
+        return {'id': student_id, 'error': 'cluster_map must be an object'}
+    points_by_cluster = {normalize(k): _points(v) for k, v in cluster_map.items()}
+    if points is None and not any(v is not None for v in points_by_cluster.values()):
+        return {'id': student_id, 'error': 'points or cluster_map required'}
+
+    reach = bool(profile.get('reach'))
+    unis = _as_list(profile.get('uni'))
+    allowed = set(index.positions('institution', unis)) if unis else None
+    clusters = index.cluster_keys(_as_list(profile.get('cluster'))) if profile.get('cluster') else index.cluster_keys()
+
+    counts = [0, 0, 0, 0]
+    windows = []
+    for key in clusters:
+        pts = points_by_cluster.get(key)
+        if pts is None:
+            pts = points
+        if pts is None:
+            # No points for this cluster: nothing to classify against
+            continue
+
+        if allowed is None:
+            for i, n in enumerate(index.status_counts(pts, key)):
+                counts[i] += n
+        else:
+            # University filter: only that uni's programmes in the cluster
+            for pos in index.by_cluster[key]:
+                if pos in allowed:
+                    counts[STATUSES.index(assess(pts, index.cutoffs[pos])['status'])] += 1
+
+        windows.append(zip(repeat(pts), index.window(points_window(pts, reach), cluster=key)))
+
+    # Shortlist: the student's relevance windows merged in (cutoff DESC, code) order
+    candidates = heapq.merge(*windows, key=lambda item: item[1])
+    if allowed is not None:
+        candidates = (item for item in candidates if item[1] in allowed)
+
+    programmes = []
+    for pts, pos in islice(candidates, limit):
+        cutoff = index.cutoffs[pos]
+        result = assess(pts, cutoff)
+        programmes.append([index.records[pos]['code'], cutoff or None, result.get('diff'), result['status']])
+
+    return {
+        'id': student_id,
+        'counts': dict(zip(STATUSES, counts)),
+        'programmes': programmes
+    }
+
+def evaluate_students(profiles, limit=20):
+    """Generator of evaluate_student() results, in input order."""
+    index = get_programme_index()
+    for profile in profiles:
+        if not isinstance(profile, dict):
+            yield {'id': None, 'error': 'student profile must be an object'}
+            continue
+        yield evaluate_student(index, profile, limit)
+
+def evaluation_stream(results):
+    """JSON Lines, one student per line."""
+    for result in results:
+        yield json.dumps(result, separators=(',', ':')) + '\n'
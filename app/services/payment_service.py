@@ -1,6 +1,7 @@
 import re
 import sqlite3
-from app.db import get_users_db
+from app.db import get_users_writer
+from app.services.transaction_service import fetch_feed_row, publish_change
 
 class PaymentService:
     @staticmethod
@@ -20,18 +21,22 @@ class PaymentService:
         if not re.match(r'^[A-Z0-9]{10}$', code):
             return False, "Invalid Code Format. Must be 10 characters (e.g., SBF...)"
 
-        # 3. Duplicate Check
-        db = get_users_db()
-        try:
+        # 3. Duplicate Check + Log, as one job on the users.db writer
+        # (serialized with every other write, so the check can't race an insert)
+        def log_code(conn):
             # Check if code exists
-            cur = db.execute("SELECT id FROM transactions WHERE mpesa_code = ?", (code,))
-            if cur.fetchone():
-                return False, "This transaction code has already been used."
-                
+            if conn.execute("SELECT id FROM transactions WHERE mpesa_code = ?", (code,)).fetchone():
+                return False
             # 4. Success - Log it (Status=PENDING by default, but explicit here)
-            db.execute("INSERT INTO transactions (user_uuid, mpesa_code, status, amount) VALUES (?, ?, 'PENDING', 50)", (user_uuid, code))
-            db.commit()
-            
+            cur = conn.execute("INSERT INTO transactions (user_uuid, mpesa_code, status, amount) VALUES (?, ?, 'PENDING', 50)", (user_uuid, code))
+            return fetch_feed_row(conn, cur.lastrowid)
+
+        try:
+            row = get_users_writer().execute(log_code)
+            if row is False:
+                return False, "This transaction code has already been used."
+            # 5. Live-update admin dashboards
+            publish_change(row)
             return True, "Payment Submitted. Pending Verification."
         except sqlite3.Error as e:
             return False, f"Database error: {str(e)}"
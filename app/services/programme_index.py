@@ -0,0 +1,392 @@
+import json
+import math
+import re
+import threading
+from bisect import bisect_left, bisect_right
+from flask import current_app
+from app.db import get_programmes_db, get_dataset_version
+
+# Cutoffs live in programme_cutoffs(code, year, cutoff), one row per programme
+# and year, so a new KUCCPS cycle is just new rows. Records carry them as a
+# {year: cutoff} dict under 'cutoffs'; the years in a dataset come from the data.
+# Databases from before the long table still have one cutoff_<year> column per year
+# (the same names the export uses for its per-year columns).
+CUTOFF_COLUMN = re.compile(r'^cutoff_(\d{4})$')
+
+def normalize(value):
+    """Case/spacing-insensitive key, mirrors what `LIKE ?` (no wildcards) matched."""
+    return ' '.join(str(value).split()).casefold()
+
+# Derived per-programme columns written by scripts/import_data.py
+DERIVED_COLUMNS = ('latest_cutoff', 'latest_year', 'history', 'history_labels', 'trend', 'trend_color',
+                   'forecast', 'forecast_low', 'forecast_high', 'volatility')
+
+# Each year back counts this much less in the regression
+FORECAST_DECAY = 0.7
+# Two-sided 80% band
+FORECAST_Z = 1.2816
+# Band half-width when there is too little history to estimate one
+FORECAST_MIN_SPREAD = 1.0
+
+def latest_cutoff(cutoffs):
+    """
+    (cutoff, year) of the newest year with a cutoff in a {year: cutoff} dict;
+    (0.0, None) when the programme has no history at all.
+    """
+    for year in sorted(cutoffs, reverse=True):
+        if cutoffs[year]:
+            return cutoffs[year], year
+    return 0.0, None
+
+def cutoff_history(cutoffs):
+    """Valid (year, cutoff) points oldest first, as (values, years) lists."""
+    years = sorted(year for year, val in cutoffs.items() if val and val > 0)
+    return [cutoffs[year] for year in years], years
+
+def dataset_years(records):
+    """Every year with a cutoff in any record, newest first."""
+    years = set()
+    for rec in records:
+        years.update(rec['cutoffs'])
+    return tuple(sorted(years, reverse=True))
+
+def classify_trend(history):
+    """
+    Admissions Forecasting label for a cutoff history.
+    Returns (trend, trend_color).
+    """
+    trend = "Stable ⚖️"
+    trend_color = "text-gray-500"
+
+    if len(history) >= 3:
+        diff = history[-1] - history[0]
+
+        if diff > 1.5:
+            trend = "Rising 🔥" # Harder
+            trend_color = "text-red-600"
+        elif diff < -1.5:
+            trend = "Falling 📉" # Easier (Opp)
+            trend_color = "text-green-600"
+        elif (max(history) - min(history)) > 3.0:
+            # Check for volatility (Dip Detection)
+            # Simple check: max - min > 3 but start/end are close
+            trend = "Volatile ⚡"
+            trend_color = "text-amber-600"
+
+    return trend, trend_color
+
+def forecast_cutoff(values, years, target_year):
+    """
+    Cutoff for `target_year` (the intake after the dataset's newest year)
+    from a (values, years) history, oldest first.
+
+    Weighted least-squares line, recent years weighted up (FORECAST_DECAY per
+    year back), with a prediction band from the weighted residuals.
+    Returns (forecast, low, high, volatility); volatility is the residual
+    spread in points, None when there are fewer than three years.
+    All None when there is no history.
+    """
+    n = len(values)
+    if not n:
+        return None, None, None, None
+
+    if n < 3:
+        # Too short for a slope worth trusting: carry the last value forward
+        forecast = values[-1]
+        spread = max(abs(values[-1] - values[0]), FORECAST_MIN_SPREAD)
+        volatility = None
+    else:
+        weights = [FORECAST_DECAY ** (years[-1] - y) for y in years]
+        total = sum(weights)
+        weights = [w / total for w in weights]
+        x_mean = sum(w * x for w, x in zip(weights, years))
+        y_mean = sum(w * y for w, y in zip(weights, values))
+        sxx = sum(w * (x - x_mean) ** 2 for w, x in zip(weights, years))
+        slope = sum(w * (x - x_mean) * (y - y_mean) for w, x, y in zip(weights, years, values)) / sxx
+        forecast = y_mean + slope * (target_year - x_mean)
+
+        residual = sum(w * (y - (y_mean + slope * (x - x_mean))) ** 2 for w, x, y in zip(weights, years, values))
+        volatility = math.sqrt(residual * n / (n - 2))
+        n_eff = 1 / sum(w * w for w in weights)
+        spread = FORECAST_Z * volatility * math.sqrt(1 + 1 / n_eff + (target_year - x_mean) ** 2 / (sxx * n_eff))
+        spread = max(spread, FORECAST_MIN_SPREAD)
+        volatility = round(volatility, 3)
+
+    # Cutoffs live on the 0-48 KCSE scale
+    clamp = lambda v: round(min(max(v, 0.0), 48.0), 3)
+    return clamp(forecast), clamp(forecast - spread), clamp(forecast + spread), volatility
+
+def derive(record, forecast_year):
+    """
+    Fill the derived columns of a raw programme record (with its 'cutoffs'
+    dict) in place. `forecast_year` is the dataset's newest year + 1.
+    """
+    record['latest_cutoff'], record['latest_year'] = latest_cutoff(record['cutoffs'])
+    record['history'], record['history_labels'] = cutoff_history(record['cutoffs'])
+    record['trend'], record['trend_color'] = classify_trend(record['history'])
+    (record['forecast'], record['forecast_low'],
+     record['forecast_high'], record['volatility']) = forecast_cutoff(record['history'], record['history_labels'], forecast_year)
+    return record
+
+# Placeholder values left in the source data; never offered as suggestions
+JUNK_VALUES = ('', '#N/A', 'N/A')
+
+class PrefixIndex:
+    """
+    Autocomplete over a set of display values, each with a count.
+
+    Every word of every value is stored once in a sorted (token, value id)
+    array, so all values with a word starting with a prefix are one bisect
+    range. A query matches a value when each query word prefixes one of its words.
+    """
+
+    def __init__(self, counts):
+        # counts: {display value: number of programmes}
+        self.values = sorted(counts, key=normalize)
+        self.counts = tuple(counts[v] for v in self.values)
+        self._normalized = tuple(normalize(v) for v in self.values)
+
+        pairs = sorted({
+            (token, vid)
+            for vid, value in enumerate(self._normalized)
+            for token in self.tokens(value)
+        })
+        self._tokens = tuple(token for token, _ in pairs)
+        self._ids = tuple(vid for _, vid in pairs)
+
+    @staticmethod
+    def tokens(value):
+        return re.findall(r'\w+', value.casefold())
+
+    def _prefixed(self, prefix):
+        lo = bisect_left(self._tokens, prefix)
+        hi = bisect_left(self._tokens, prefix + '\U0010ffff', lo)
+        return set(self._ids[lo:hi])
+
+    def lookup(self, query, limit=20):
+        """
+        Top `limit` (value, count) pairs for `query`: values that start with
+        the whole query first, then by programme count, then alphabetically.
+        """
+        words = self.tokens(query or '')
+        if words:
+            # Longest word first: usually the narrowest range
+            words.sort(key=len, reverse=True)
+            matched = self._prefixed(words[0])
+            for word in words[1:]:
+                if not matched:
+                    break
+                matched &= self._prefixed(word)
+        else:
+            matched = range(len(self.values))
+
+        q = normalize(query or '')
+        ranked = sorted(matched, key=lambda vid: (not self._normalized[vid].startswith(q), -self.counts[vid], vid))
+        return [(self.values[vid], self.counts[vid]) for vid in ranked[:limit]]
+
+class ProgrammeIndex:
+    """
+    Immutable, in-memory copy of the `programmes` table.
+
+    Records are stored once, pre-sorted by latest cutoff (DESC) then code, so a
+    position in `self.records` is also the rank used by `ORDER BY cutoff DESC, code`.
+    Lookup tables map a normalized institution / cluster / course name to the
+    sorted tuple of positions that carry it; `by_code` maps a code to its position.
+
+    Points windows are answered with bisect over negated cutoffs (ascending),
+    globally and per cluster, so a window is a contiguous, already-ordered slice.
+    `years` are the cutoff years present in the data, newest first.
+    """
+
+    def __init__(self, records):
+        self.years = dataset_years(records)
+
+        # Code breaks cutoff ties, so the order is total and pages are stable
+        records.sort(key=self.sort_key)
+        self.records = tuple(records)
+        self.cutoffs = tuple(rec['latest_cutoff'] for rec in records)
+        self._keys = tuple(-c for c in self.cutoffs)
+        self._sort_keys = tuple(self.sort_key(rec) for rec in records)
+
+        self.by_code = {rec['code']: pos for pos, rec in enumerate(records)}
+        self.by_name = self._group('name')
+        self.by_institution = self._group('institution')
+        self.by_cluster = self._group('cluster')
+        self._cluster_keys = {
+            key: tuple(self._keys[p] for p in positions)
+            for key, positions in self.by_cluster.items()
+        }
+        # Autocomplete, built on first use per field
+        self._suggest = {}
+
+    @staticmethod
+    def sort_key(rec):
+        return (-rec['latest_cutoff'], rec['code'] or '')
+
+    def seek(self, cutoff, code):
+        """First position strictly after (cutoff, code) in index order; a keyset cursor."""
+        return bisect_right(self._sort_keys, (-cutoff, code))
+
+    def _group(self, field):
+        groups = {}
+        for pos, rec in enumerate(self.records):
+            # Missing values share the '' bucket so every row belongs to a group
+            groups.setdefault(normalize(rec.get(field) or ''), []).append(pos)
+        return {key: tuple(positions) for key, positions in groups.items()}
+
+    def __len__(self):
+        return len(self.records)
+
+    def positions(self, field, values):
+        """Sorted positions whose `field` matches any of `values` (normalized)."""
+        table = getattr(self, f'by_{field}')
+        if isinstance(values, str):
+            values = [values]
+        hits = set()
+        for value in values:
+            hits.update(table.get(normalize(value), ()))
+        return sorted(hits)
+
+    def raw_values(self, field, values):
+        """Exact stored values of `field` that match any of `values` (normalized), for SQL IN lists."""
+        if isinstance(values, str):
+            values = [values]
+        return sorted({
+            self.records[pos][field]
+            for value in values
+            for pos in getattr(self, f'by_{field}').get(normalize(value), ())
+            if self.records[pos][field] is not None
+        })
+
+    def cluster_keys(self, values=None):
+        """Normalized cluster keys present in the index (optionally restricted to `values`)."""
+        if values is None:
+            return list(self.by_cluster)
+        if isinstance(values, str):
+            values = [values]
+        keys = {normalize(v) for v in values}
+        return [key for key in self.by_cluster if key in keys]
+
+    def window(self, bounds, cluster=None, after=0):
+        """
+        Positions with floor <= cutoff <= ceiling, in (cutoff DESC, code) order.
+        `bounds` is a (floor, ceiling) tuple or None for no window.
+        `cluster` is a normalized cluster key; None means the whole index.
+        `after` skips positions before it (see seek()).
+        """
+        if cluster is None:
+            positions, keys = range(len(self.records)), self._keys
+        else:
+            positions, keys = self.by_cluster.get(cluster, ()), self._cluster_keys.get(cluster, ())
+        lo, hi = 0, len(positions)
+        if bounds is not None:
+            floor, ceiling = bounds
+            lo, hi = bisect_left(keys, -ceiling), bisect_right(keys, -floor)
+        if after:
+            lo = max(lo, bisect_left(positions, after))
+        return positions[lo:hi]
+
+    def status_counts(self, points, cluster=None):
+        """
+        (safe, tight, risk, unknown) counts for `points` against every programme
+        in `cluster` (None: all), with search_service.assess()'s thresholds.
+        Three bisects, no per-programme work.
+        """
+        keys = self._keys if cluster is None else self._cluster_keys.get(cluster, ())
+        known = bisect_left(keys, 0)            # cutoff > 0
+        above = bisect_left(keys, -points)      # cutoff > points
+        risk = bisect_left(keys, -(points + 2))  # cutoff > points + 2
+        return known - above, above - risk, risk, len(keys) - known
+
+    def suggest(self, field, query, limit=20):
+        """(value, programme count) autocomplete matches for `field` (name / institution / cluster)."""
+        prefix_index = self._suggest.get(field)
+        if prefix_index is None:
+            counts = {}
+            for positions in getattr(self, f'by_{field}').values():
+                # Spacing variants share a key; offer the first stored spelling
+                value = self.records[positions[0]][field]
+                if (value or '') not in JUNK_VALUES:
+                    counts[value] = len(positions)
+            prefix_index = self._suggest[field] = PrefixIndex(counts)
+        return prefix_index.lookup(query, limit)
+
+    def row(self, pos):
+        """Fresh dict for a position; callers are free to mutate it."""
+        rec = dict(self.records[pos])
+        del rec['latest_cutoff']
+        return rec
+
+    @property
+    def forecast_year(self):
+        return self.years[0] + 1 if self.years else None
+
+    @classmethod
+    def from_db(cls, db):
+        existing = {r[1] for r in db.execute("PRAGMA table_info(programmes)")}
+        materialized = all(col in existing for col in DERIVED_COLUMNS)
+        # Wide cutoff_<year> columns on databases from before programme_cutoffs
+        legacy = {}
+        for col in existing:
+            m = CUTOFF_COLUMN.match(col)
+            if m:
+                legacy[col] = int(m.group(1))
+
+        columns = ('code', 'institution', 'name', 'cluster') + tuple(legacy)
+        if materialized:
+            columns += DERIVED_COLUMNS
+        rows = db.execute(f"SELECT {', '.join(columns)} FROM programmes").fetchall()
+
+        records = []
+        for r in rows:
+            rec = dict(r)
+            rec['cutoffs'] = {year: rec.pop(col) for col, year in legacy.items() if rec[col] is not None}
+            if materialized:
+                rec['history'] = json.loads(rec['history'])
+                rec['history_labels'] = json.loads(rec['history_labels'])
+            records.append(rec)
+
+        if not legacy:
+            # One pass over the (code, year) primary key, already grouped by code
+            by_code = {rec['code']: rec['cutoffs'] for rec in records}
+            for code, year, cutoff in db.execute("SELECT code, year, cutoff FROM programme_cutoffs"):
+                if code in by_code:
+                    by_code[code][year] = cutoff
+
+        if not materialized:
+            # Database predates scripts/import_data.py derived columns
+            years = dataset_years(records)
+            for rec in records:
+                derive(rec, years[0] + 1 if years else None)
+        return cls(records)
+
+# One index per worker process, rebuilt only when programmes.db changes on disk
+_index = None
+_index_key = None
+_index_lock = threading.Lock()
+
+def load_programme_index(version):
+    """
+    The compiled snapshot (scripts/build_snapshot.py) when there is one for
+    this programmes.db version: it maps in without SQL or per-row work.
+    Otherwise the index is built from the database.
+    """
+    from app.services.snapshot import SnapshotIndex
+    path = current_app.config.get('PROGRAMMES_SNAPSHOT')
+    index = SnapshotIndex.open(path, version) if path else None
+    if index is None:
+        # Missing or stale snapshot
+        index = ProgrammeIndex.from_db(get_programmes_db())
+    return index
+
+def get_programme_index():
+    global _index, _index_key
+    version = get_dataset_version()
+    key = (current_app.config['PROGRAMMES_DB'], version)
+
+    if _index is None or _index_key != key:
+        with _index_lock:
+            if _index is None or _index_key != key:
+                _index = load_programme_index(version)
+                _index_key = key
+    return _index
@@ -1,9 +1,21 @@
-from app.db import get_programmes_db
+from flask import current_app
+from app.db import get_programmes_db, get_dataset_version
+from app.services.programme_index import get_programme_index, normalize
+from app.services.cache import ResultCache
+from collections import namedtuple
+from itertools import islice
+import base64
+import gzip
+import heapq
+import json
 import re
+import sqlite3
 
 def get_filter_options():
-    db = get_programmes_db()
-    
+    return filter_options_from_db(get_programmes_db())
+
+def filter_options_from_db(db):
+    """University and cluster lists for the filter pickers (also compiled into the snapshot)."""
     def fetch_col(col):
         # Fetch distinct non-empty values, exclude dirty data
         c = db.execute(f"SELECT DISTINCT {col} FROM programmes WHERE {col} IS NOT NULL AND {col} != '' AND {col} NOT IN ('#N/A', 'N/A') ORDER BY {col} ASC")
@@ -24,190 +36,418 @@ def get_filter_options():
             
     clusters.sort(key=cluster_sorter)
 
+    # Course names are not shipped here; the course picker queries /api/suggest
     return {
         'universities': fetch_col('institution'),
-        'clusters': clusters,
-        'courses': fetch_col('name')
+        'clusters': clusters
     }
 
-def search(course_name=None, institution=None, cluster=None, user_points=None, tier='basic', reach=False, cluster_map=None):
+# Pre-serialized /api/filters body (and its gzip encoding) for one dataset version
+FilterPayload = namedtuple('FilterPayload', 'version body gzipped')
+_filter_payloads = {}
+
+def get_filter_payload():
+    """get_filter_options() serialized once per programmes.db version."""
+    version = get_dataset_version()
+    payload = _filter_payloads.get(version)
+    if payload is None:
+        # A snapshot index carries the lists already serialized
+        body = getattr(get_programme_index(), 'filter_options', None)
+        if body is None:
+            body = json.dumps(get_filter_options(), separators=(',', ':')).encode('utf-8')
+        gzipped = gzip.compress(body, 9, mtime=0) if current_app.config.get('FILTERS_GZIP', True) else None
+        payload = FilterPayload(version, body, gzipped)
+        # Only the current version is ever served
+        _filter_payloads.clear()
+        _filter_payloads[version] = payload
+    return payload
+
+# /api/suggest field names -> programme columns
+SUGGEST_FIELDS = {'course': 'name', 'institution': 'institution', 'uni': 'institution', 'cluster': 'cluster'}
+
+def suggest(field, query, limit=20):
+    """
+    Autocomplete for the filter pickers: [{'value', 'count'}] for the top
+    `limit` values of `field` with words starting with the words of `query`.
+    """
+    column = SUGGEST_FIELDS[field]
+    return [
+        {'value': value, 'count': count}
+        for value, count in get_programme_index().suggest(column, query, limit)
+    ]
+
+def cluster_points(cluster_map):
+    """cluster_map re-keyed by normalize(cluster): what effective_points_for() looks up."""
+    return {normalize(k): v for k, v in cluster_map.items()} if cluster_map else {}
+
+def effective_points_for(course_cluster, user_points, points_by_cluster=None):
+    # Logic: If we have a map, try to find specific points.
+    # Note: cluster_map keys come from frontend (TomSelect) and can differ from the DB 'course_cluster'
+    # in case/spacing, so both sides are normalized (points_by_cluster comes from cluster_points()).
+    if points_by_cluster and course_cluster:
+        return points_by_cluster.get(normalize(course_cluster), user_points)
+    return user_points
+
+def assess(effective_points, cutoff):
+    """
+    Compare a student's points with a programme cutoff.
+    Returns the fields to merge into a result: 'status' and, when both are known, 'diff'.
+    """
+    if effective_points is None or effective_points == '':
+        return {'status': 'Enter Points'}
+    try:
+        pts = float(effective_points)
+    except (TypeError, ValueError):
+        return {'status': 'Unknown'}
+    if not cutoff:
+        return {'status': 'Unknown'}
+
+    # Calculate Difference
+    diff = round(pts - cutoff, 3)
+
+    # Status Logic (All Users)
+    if pts >= cutoff:
+        status = 'Safe'
+    elif pts >= (cutoff - 2):
+        status = 'Tight' # Reach
+    else:
+        status = 'Risk'
+    return {'diff': diff, 'status': status}
+
+def points_window(points, reach=False):
+    """
+    The "Smart Floor/Ceiling" relevance window for a points value.
+    Returns (floor, ceiling), or None when points are missing or not a number.
+    """
+    if points is None or points == '':
+        return None
+    try:
+        pts = float(points)
+    except (TypeError, ValueError):
+        return None
+
+    # Smart Ceiling (Reach)
+    buffer_top = 2.0 if reach else 0.0
+    ceiling = min(pts + buffer_top, 48.0)
+
+    # Smart Floor (Relevance Window)
+    # If > 40, show down to -10 (e.g. 44 -> 34)
+    # Else, show down to -15 (e.g. 35 -> 20)
+    buffer_bottom = 10.0 if pts > 40 else 15.0
+    floor = max(pts - buffer_bottom, 0.0)
+    return floor, ceiling
+
+# --- Free-text search ---
+# programmes_fts (FTS5, trigram tokenizer) is built by scripts/import_data.py.
+# Trigrams only exist for 3+ character terms, so shorter words are ignored.
+TEXT_MIN_TERM = 3
+# Cap on ranked matches; None ranks them all. The catalogue is ~2k programmes, and
+# with a cap the text-mode total and infinite scroll stopped short of the real matches.
+TEXT_MAX_MATCHES = None
+
+# Column weights for bm25(): name, institution, cluster (code is UNINDEXED)
+_FTS_RANK = "bm25(programmes_fts, 10.0, 4.0, 1.0)"
+
+def _text_terms(query):
+    return [t for t in re.findall(r'\w+', query.casefold()) if len(t) >= TEXT_MIN_TERM]
+
+def _quote(term):
+    return '"' + term.replace('"', '""') + '"'
+
+def text_matches(query, limit=TEXT_MAX_MATCHES, codes=None):
+    """
+    Programme codes matching a free-text query, most relevant first.
+    Every term must appear (as a substring) somewhere in name/institution/cluster;
+    if nothing does, e.g. a typo, rank by how many of the query's trigrams a
+    programme shares instead. `codes` restricts the matches (uni/cluster filters)
+    before the LIMIT, so filtering never loses matches to the cap.
+    Returns None when programmes.db has no FTS index.
+    """
+    terms = _text_terms(query)
+    if not terms or codes is not None and not codes:
+        return []
+
+    db = get_programmes_db()
+    sql = "SELECT code FROM programmes_fts WHERE programmes_fts MATCH ?"
+    extra = ()
+    if codes is not None:
+        # One JSON parameter instead of a bound-parameter list that can outgrow SQLite's limit
+        sql += " AND code IN (SELECT value FROM json_each(?))"
+        extra = (json.dumps(list(codes)),)
+    sql += f" ORDER BY {_FTS_RANK} LIMIT ?"
+    limit = -1 if limit is None else limit
+    try:
+        rows = db.execute(sql, (' AND '.join(_quote(t) for t in terms), *extra, limit)).fetchall()
+        if not rows:
+            trigrams = dict.fromkeys(t[i:i + 3] for t in terms for i in range(len(t) - 2))
+            rows = db.execute(sql, (' OR '.join(_quote(t) for t in trigrams), *extra, limit)).fetchall()
+    except sqlite3.OperationalError:
+        # Database predates the search index (run scripts/import_data.py --derive-only)
+        return None
+    return [r[0] for r in rows]
+
+def _scan_matches(index, query):
+    """Unranked substring fallback for databases without programmes_fts."""
+    terms = _text_terms(query)
+    if not terms:
+        return []
+    matches = []
+    for pos, rec in enumerate(index.records):
+        haystack = normalize(f"{rec['name'] or ''} {rec['institution'] or ''} {rec['cluster'] or ''}")
+        if all(t in haystack for t in terms):
+            matches.append(pos)
+    return matches
+
+# --- Pagination ---
+# Results are keyset-paginated on (cutoff DESC, code): the cursor is the last
+# programme a page ended on, so later pages stay stable and cost the same as
+# the first. Text mode is ranked by relevance, so its cursor is an offset.
+SearchPage = namedtuple('SearchPage', 'results next_cursor total')
+
+# search() keeps returning this many results in one go
+SEARCH_LIMIT = 100
+
+def encode_search_cursor(position):
+    raw = json.dumps(position, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def decode_search_cursor(token):
+    """Returns [cutoff, code], [offset] or None for a missing/garbled cursor."""
+    if not token:
+        return None
+    try:
+        position = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        if not isinstance(position, list):
+            return None
+        if len(position) == 2:
+            return [float(position[0]), str(position[1])]
+        if len(position) == 1:
+            return [max(int(position[0]), 0)]
+    except (ValueError, TypeError):
+        pass
+    return None
+
+def search(course_name=None, institution=None, cluster=None, user_points=None, tier='basic', reach=False, cluster_map=None, query=None):
+    """First SEARCH_LIMIT results, in page order."""
+    return search_page(course_name, institution, cluster, user_points, tier, reach, cluster_map, query,
+                       page_size=SEARCH_LIMIT).results
+
+def search_page(course_name=None, institution=None, cluster=None, user_points=None, tier='basic', reach=False, cluster_map=None, query=None,
+                cursor=None, page_size=SEARCH_LIMIT, with_total=False):
+    """
+    One page of results after `cursor` (None for the first page).
+    Returns a SearchPage; next_cursor is None on the last page and total is
+    only counted when `with_total` is set.
+    """
     # SECURITY RULE 1: The "Gatekeeper"
     has_course = bool(course_name and course_name != 'All')
     has_uni = bool(institution and institution != 'All' and len(institution) > 0)
     has_cluster = bool(cluster and cluster != 'All' and len(cluster) > 0)
     has_points = bool(user_points)
+    has_query = bool(query and query.strip())
 
-    if not has_course and not has_uni and not has_cluster and not has_points:
-        return []
+    if not has_course and not has_uni and not has_cluster and not has_points and not has_query:
+        return SearchPage([], None, 0 if with_total else None)
 
-    db = get_programmes_db()
-    
-    # Base Query
-    sql = "SELECT code, institution, name, cutoff_2024, cutoff_2023, cutoff_2022, cutoff_2021, cutoff_2020, cutoff_2019, cutoff_2018, cluster FROM programmes WHERE 1=1"
-    params = []
+    index = get_programme_index()
+    position = decode_search_cursor(cursor)
+    points_by_cluster = cluster_points(cluster_map)
 
-    # Filtering
+    # Filtering (served from the in-process index, no SQL per request)
+    # Course / University filters narrow to a set of allowed positions.
+    allowed = None
     if has_course:
         # Case-insensitive match, robust to spacing
-        sql += " AND name LIKE ?"
-        params.append(course_name)
+        allowed = set(index.positions('name', course_name))
 
     if has_uni:
-        if isinstance(institution, list):
-            placeholders = ','.join(['?'] * len(institution))
-            sql += f" AND institution IN ({placeholders})"
-            params.extend(institution)
-        else:
-            sql += " AND institution LIKE ?"
-            params.append(institution)
-
-    if has_cluster:
-        if isinstance(cluster, list):
-            placeholders = ','.join(['?'] * len(cluster))
-            sql += f" AND cluster IN ({placeholders})"
-            params.extend(cluster)
+        matched = set(index.positions('institution', institution))
+        allowed = matched if allowed is None else allowed & matched
+
+    clusters = index.cluster_keys(cluster) if has_cluster else None
+
+    # TEXT MODE: free-text query, results in relevance order. Like an explicit
+    # course search, points only drive the status, never hide a match.
+    if has_query:
+        if clusters is not None:
+            in_clusters = {p for key in clusters for p in index.by_cluster[key]}
+            allowed = in_clusters if allowed is None else allowed & in_clusters
+        # Filters go into the FTS query itself, ahead of any TEXT_MAX_MATCHES cap
+        codes = text_matches(query, codes=None if allowed is None else [index.records[p]['code'] for p in allowed])
+        if codes is None:
+            matches = _scan_matches(index, query)
         else:
-            sql += " AND cluster LIKE ?"
-            params.append(cluster)
+            matches = [index.by_code[c] for c in codes if c in index.by_code]
+        if allowed is not None:
+            matches = [p for p in matches if p in allowed]
+
+        # Every ranked match is in hand (total and next_cursor count them all), so an offset is cheap
+        offset = position[0] if position and len(position) == 1 else 0
+        end = offset + page_size
+        next_cursor = encode_search_cursor([end]) if len(matches) > end else None
+        results = _build_results(index, matches[offset:end], user_points, points_by_cluster)
+        return SearchPage(results, next_cursor, len(matches) if with_total else None)
 
     # Points-Driven Discovery (Reach Logic) 
-    # LEGACY MODE: If we only have global points, filter at SQL level for efficiency.
-    # DYNAMIC MODE: If we have a cluster_map, we CANNOT filter effectively in SQL (would require complex ORs).
-    # So we skip SQL filtering and let Python handle the "Safe/Risk" status.
-    # Points-Driven Discovery (Reach Logic) 
-    # LEGACY MODE: If we only have global points, filter at SQL level for efficiency.
-    # DYNAMIC MODE: If we have a cluster_map, we CANNOT filter effectively in SQL (would require complex ORs).
-    # So we skip SQL filtering and let Python handle the "Safe/Risk" status.
+    # Every window is a bisect over (cutoff DESC, code)-sorted positions, so each
+    # range is already in page order and ranges merge without a re-sort.
+    # DYNAMIC MODE: If we have a cluster_map, each cluster gets its own window
+    # (clusters missing from the map fall back to the global points).
+    # LEGACY MODE: If we only have global points, one window for every cluster.
     # EXPLICIT MODE: If user searches for a specific course (has_course), DO NOT filter by points. Show it always.
-    if user_points and not cluster_map and not has_course:
-        try:
-            pts = float(user_points)
-            
-            # Smart Ceiling (Reach)
-            buffer_top = 2.0 if reach else 0.0
-            ceiling = min(pts + buffer_top, 48.0)
-            
-            # Smart Floor (Relevance Window)
-            # If > 40, show down to -10 (e.g. 44 -> 34)
-            # Else, show down to -15 (e.g. 35 -> 20)
-            buffer_bottom = 10.0 if pts > 40 else 15.0
-            floor = max(pts - buffer_bottom, 0.0)
-            
-            sql += " AND (COALESCE(cutoff_2024, cutoff_2023, cutoff_2022, cutoff_2021, cutoff_2020, cutoff_2019, cutoff_2018, 0) BETWEEN ? AND ?)"
-            params.extend([floor, ceiling])
+    def windows(after):
+        if points_by_cluster:
+            return [
+                index.window(points_window(points_by_cluster.get(key, user_points) if key else user_points, reach), cluster=key, after=after)
+                for key in (clusters if clusters is not None else index.cluster_keys())
+            ]
+        bounds = points_window(user_points, reach) if not has_course else None
+        if clusters is not None:
+            return [index.window(bounds, cluster=key, after=after) for key in clusters]
+        if bounds is None and allowed is not None:
+            return [sorted(p for p in allowed if p >= after)]
+        return [index.window(bounds, after=after)]
 
-        except ValueError:
-            pass
+    after = index.seek(*position) if position and len(position) == 2 else 0
+    ranges = windows(after)
+    candidates = iter(ranges[0]) if len(ranges) == 1 else heapq.merge(*ranges)
+    if allowed is not None:
+        candidates = (p for p in candidates if p in allowed)
 
-    # Sorting
-    sql += " ORDER BY COALESCE(cutoff_2024, cutoff_2023, cutoff_2022, cutoff_2021, cutoff_2020, cutoff_2019, cutoff_2018, 0) DESC"
-    
-    # Limit
-    sql += " LIMIT 100"
+    # One extra row only tells us whether another page exists
+    positions = list(islice(candidates, page_size + 1))
+    next_cursor = None
+    if len(positions) > page_size:
+        positions = positions[:page_size]
+        last = index.records[positions[-1]]
+        next_cursor = encode_search_cursor([last['latest_cutoff'], last['code']])
 
-    cursor = db.execute(sql, params)
-    rows = cursor.fetchall()
-    
-    results = []
-    for r in rows:
-        item = dict(r)
-        # Use latest available cutoff
-        cutoff = item['cutoff_2024'] or item['cutoff_2023'] or item['cutoff_2022'] or item['cutoff_2021'] or item['cutoff_2020'] or item['cutoff_2019'] or item['cutoff_2018'] or 0.0
-        course_cluster = item['cluster']
-        
-        # Determine Effective Points
-        effective_points = user_points
-        
-        # Logic: If we have a map, try to find specific points.
-        # Note: cluster_map keys come from frontend (TomSelect), values in DB 'course_cluster' match that format.
-        if cluster_map and course_cluster and course_cluster in cluster_map:
-            effective_points = cluster_map[course_cluster]
-
-        if effective_points is not None and effective_points != '':
-            try:
-                pts = float(effective_points)
-                
-                # Dynamic Mode Filtering (Python Side)
-                # If we are using a cluster map, we skipped the SQL filter. We must apply the Window here.
-                if cluster_map:
-                    buffer_top = 2.0 if reach else 0.0
-                    ceiling = min(pts + buffer_top, 48.0)
-                    buffer_bottom = 10.0 if pts > 40 else 15.0
-                    floor = max(pts - buffer_bottom, 0.0)
-                    
-                    # Skip noise
-                    if not (floor <= float(cutoff) <= ceiling):
-                        continue
-
-                if cutoff:
-                    # Calculate Difference
-                    diff = pts - cutoff
-                    item['diff'] = round(diff, 3) 
-                    
-                    # Status Logic (All Users)
-                    if pts >= cutoff:
-                        item['status'] = 'Safe'
-                    elif pts >= (cutoff - 2):
-                            item['status'] = 'Tight' # Reach
-                    else:
-                            item['status'] = 'Risk'
-                else:
-                    item['status'] = 'Unknown'
-            except ValueError:
-                item['status'] = 'Unknown'
+    total = None
+    if with_total:
+        # Window lengths are free; only a course/uni filter needs a pass over them
+        first = windows(0) if after else ranges
+        if allowed is None:
+            total = sum(len(w) for w in first)
         else:
-            item['status'] = 'Enter Points'
+            total = sum(1 for w in first for p in w if p in allowed)
+
+    return SearchPage(_build_results(index, positions, user_points, points_by_cluster), next_cursor, total)
+
+def _build_results(index, positions, user_points, points_by_cluster):
+    results = []
+    for pos in positions:
+        item = index.row(pos)
+        # Latest available cutoff (precomputed by the index)
+        cutoff = index.cutoffs[pos]
+        # User-specific part: diff + Safe/Tight/Risk status
+        effective_points = effective_points_for(item['cluster'], user_points, points_by_cluster)
+        item.update(assess(effective_points, cutoff))
+
+        # Same check against next year's forecast (fitted at import time)
+        if item.get('forecast') is not None:
+            outlook = assess(effective_points, item['forecast'])
+            item['forecast_status'] = outlook['status']
+            if 'diff' in outlook:
+                item['forecast_diff'] = outlook['diff']
 
         # Force cutoff visibility
         item['cutoff'] = cutoff if cutoff > 0 else None
         
-        # --- PREMIUM: Admissions Forecasting ---
         # --- FORECASTING: Available for All ---
-        if True:
-            # 1. Extract History (2018 -> 2024)
-            # Create a list of tuples (Year, Cutoff) for available data
-            raw_history = [
-                (2018, item.get('cutoff_2018')),
-                (2019, item.get('cutoff_2019')),
-                (2020, item.get('cutoff_2020')),
-                (2021, item.get('cutoff_2021')),
-                (2022, item.get('cutoff_2022')),
-                (2023, item.get('cutoff_2023')),
-                (2024, item.get('cutoff_2024'))
-            ]
-            
-            # Filter valid points
-            valid_history = [val for year, val in raw_history if val and val > 0]
-            item['history'] = valid_history # List of values e.g. [22.4, 23.5, ...]
-            item['history_labels'] = [year for year, val in raw_history if val and val > 0]
-            
-            # 2. Trend Analysis
-            trend = "Stable ⚖️"
-            trend_color = "text-gray-500"
-            
-            if len(valid_history) >= 3:
-                first = valid_history[0]
-                last = valid_history[-1]
-                
-                diff = last - first
-                
-                if diff > 1.5:
-                    trend = "Rising 🔥" # Harder
-                    trend_color = "text-red-600"
-                elif diff < -1.5:
-                    trend = "Falling 📉" # Easier (Opp)
-                    trend_color = "text-green-600"
-                else:
-                    # Check for volatility (Dip Detection)
-                    # Simple check: max - min > 3 but start/end are close
-                    if (max(valid_history) - min(valid_history)) > 3.0:
-                         trend = "Volatile ⚡"
-                         trend_color = "text-amber-600"
-            
-            item['trend'] = trend
-            item['trend_color'] = trend_color
-        # ---------------------------------------
-            
+        # history, history_labels, trend/trend_color and the next-year forecast
+        # (forecast, forecast_low/high, volatility) are materialized at import
+        # time (scripts/import_data.py) and carried on the index record.
+
         results.append(item)
         
     return results
+
+# --- Columnar JSON (/api/search) ---
+SEARCH_FIELDS = ('code', 'name', 'institution', 'cluster', 'cutoff', 'diff', 'status',
+                 'trend', 'trend_color', 'history', 'history_labels',
+                 'forecast', 'forecast_low', 'forecast_high', 'volatility', 'forecast_diff', 'forecast_status')
+DEFAULT_SEARCH_FIELDS = ('code', 'name', 'institution', 'cluster', 'cutoff', 'diff', 'status', 'trend', 'history', 'history_labels')
+
+def parse_search_fields(value):
+    """Comma-separated field names -> tuple; raises ValueError on unknown names."""
+    if not value:
+        return DEFAULT_SEARCH_FIELDS
+    fields = tuple(dict.fromkeys(f.strip() for f in value.split(',') if f.strip()))
+    unknown = [f for f in fields if f not in SEARCH_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return fields
+
+def to_columns(results, fields):
+    """Results as {field: [value per result]}: each field name is sent once."""
+    return {field: [r.get(field) for r in results] for field in fields}
+
+# --- Result Cache ---
+# Popular cluster + points combinations repeat constantly during placement season.
+_search_cache = None
+
+def get_search_cache():
+    global _search_cache
+    if _search_cache is None:
+        config = current_app.config
+        _search_cache = ResultCache(
+            'search',
+            max_weight=config['SEARCH_CACHE_MAX_ROWS'],
+            ttl=config['SEARCH_CACHE_TTL'],
+            # Weight by result rows, the dominant memory cost of an entry
+            weigher=lambda page: len(page.results) + 1
+        )
+    return _search_cache
+
+def _canonical_points(points):
+    # The UI steps in 0.001, so anything finer is noise that would fragment the cache
+    if points is None or points == '':
+        return None
+    try:
+        return format(round(float(points), 3), 'g')
+    except (TypeError, ValueError):
+        return str(points)
+
+def _canonical_list(values):
+    if not values:
+        return None
+    if isinstance(values, str):
+        values = [values]
+    return tuple(sorted({normalize(v) for v in values}))
+
+def cached_search(course_name=None, institution=None, cluster=None, user_points=None, tier='basic', reach=False, cluster_map=None, query=None):
+    """search() behind the result cache."""
+    return cached_search_page(course_name, institution, cluster, user_points, tier, reach, cluster_map, query,
+                              page_size=SEARCH_LIMIT).results
+
+def cached_search_page(course_name=None, institution=None, cluster=None, user_points=None, tier='basic', reach=False, cluster_map=None, query=None,
+                       cursor=None, page_size=SEARCH_LIMIT, with_total=False):
+    """
+    search_page() behind the result cache. Arguments are canonicalized first so
+    equivalent queries (list order, case, points precision) share one entry.
+    """
+    user_points = _canonical_points(user_points)
+    cluster_map = {normalize(k): _canonical_points(v) for k, v in cluster_map.items()} if cluster_map else None
+
+    key = (
+        normalize(course_name) if course_name else None,
+        _canonical_list(institution),
+        _canonical_list(cluster),
+        user_points,
+        tier,
+        bool(reach),
+        tuple(sorted(cluster_map.items())) if cluster_map else None,
+        ' '.join(_text_terms(query)) if query else None,
+        cursor or None,
+        page_size,
+        bool(with_total)
+    )
+
+    cache = get_search_cache()
+    version = get_dataset_version()
+    page = cache.get(key, version)
+    if page is None:
+        page = search_page(course_name, institution, cluster, user_points, tier, reach, cluster_map, query,
+                           cursor=cursor, page_size=page_size, with_total=with_total)
+        cache.set(key, page, version)
+    return page
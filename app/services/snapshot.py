@@ -0,0 +1,318 @@
+import json
+import math
+import mmap
+import os
+import struct
+import sys
+from array import array
+from collections.abc import Mapping, Sequence
+from app.services.programme_index import ProgrammeIndex, cutoff_history
+
+# Binary catalogue snapshot: a ProgrammeIndex compiled to flat arrays.
+#
+#   MAGIC | u32 header length | JSON header | sections, each 8-byte aligned
+#
+# The header names every section (offset, length, array typecode) and carries
+# the dataset version of the programmes.db it was built from. Sections are
+# fixed-width arrays in index order (one slot per programme) plus one string
+# table, so opening a snapshot is an mmap and a few memoryview casts: no SQL,
+# and programme dicts are only built for the positions a request touches.
+# Written by scripts/build_snapshot.py (import_data.py runs it after a swap).
+MAGIC = b'SARSNAP\x00'
+FORMAT = 1
+
+# String ids for None / missing numbers
+NO_STRING = 0xFFFFFFFF
+NO_YEAR = 0
+
+STRING_FIELDS = ('code', 'institution', 'name', 'cluster', 'trend', 'trend_color')
+FLOAT_FIELDS = ('forecast', 'forecast_low', 'forecast_high', 'volatility')
+GROUP_FIELDS = ('name', 'institution', 'cluster')
+
+def _float(value):
+    return math.nan if value is None else value
+
+def write_snapshot(index, path, version, filter_options):
+    """
+    Compile a ProgrammeIndex (plus the /api/filters lists) into a snapshot
+    at `path`. Written to a temp file and swapped in, like programmes.db.
+    """
+    strings = {}
+
+    def sid(value):
+        if value is None:
+            return NO_STRING
+        return strings.setdefault(value, len(strings))
+
+    records = index.records
+    sections = {}
+    for field in STRING_FIELDS:
+        sections[field] = array('I', (sid(rec[field]) for rec in records))
+    sections['latest_cutoff'] = array('d', index.cutoffs)
+    sections['sort_key'] = array('d', index._keys)
+    sections['latest_year'] = array('i', (rec['latest_year'] or NO_YEAR for rec in records))
+    for field in FLOAT_FIELDS:
+        sections[field] = array('d', (_float(rec[field]) for rec in records))
+    # One row of cutoffs per programme on the dataset's year axis (newest first)
+    sections['cutoffs'] = array('d', (_float(rec['cutoffs'].get(year)) for rec in records for year in index.years))
+    sections['code_order'] = array('I', sorted(range(len(records)), key=lambda pos: records[pos]['code'] or ''))
+
+    for field in GROUP_FIELDS:
+        groups = getattr(index, f'by_{field}')
+        keys = sorted(groups)
+        offsets, positions = array('I', [0]), array('I')
+        for key in keys:
+            positions.extend(groups[key])
+            offsets.append(len(positions))
+        sections[f'{field}_keys'] = array('I', (sid(key) for key in keys))
+        sections[f'{field}_offsets'] = offsets
+        sections[f'{field}_positions'] = positions
+        if field == 'cluster':
+            sections['cluster_sort_keys'] = array('d', (index._keys[pos] for pos in positions))
+
+    encoded = [value.encode('utf-8') for value in strings]
+    string_offsets = array('I', [0])
+    for value in encoded:
+        string_offsets.append(string_offsets[-1] + len(value))
+    sections['string_offsets'] = string_offsets
+    sections['string_data'] = b''.join(encoded)
+    sections['filters'] = json.dumps(filter_options, separators=(',', ':')).encode('utf-8')
+
+    # Offsets are relative to the start of the section area, so the header can be sized last
+    layout, blobs, position = {}, [], 0
+    for name, data in sections.items():
+        raw = data.tobytes() if isinstance(data, array) else data
+        typecode = data.typecode if isinstance(data, array) else 'B'
+        layout[name] = (position, len(raw), typecode)
+        padding = -len(raw) % 8
+        blobs.append(raw + b'\x00' * padding)
+        position += len(raw) + padding
+
+    header = json.dumps({
+        'format': FORMAT,
+        'version': version,
+        'byteorder': sys.byteorder,
+        'count': len(records),
+        'years': index.years,
+        'sections': layout,
+    }).encode('utf-8')
+    header += b' ' * (-(len(MAGIC) + 4 + len(header)) % 8)
+
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(MAGIC)
+            f.write(struct.pack('<I', len(header)))
+            f.write(header)
+            for blob in blobs:
+                f.write(blob)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+class _Strings:
+    """The snapshot's string table; each string is decoded once, on first use."""
+
+    def __init__(self, offsets, data):
+        self._offsets = offsets
+        self._data = data
+        self._decoded = {}
+
+    def __getitem__(self, sid):
+        if sid == NO_STRING:
+            return None
+        value = self._decoded.get(sid)
+        if value is None:
+            value = self._decoded[sid] = str(self._data[self._offsets[sid]:self._offsets[sid + 1]], 'utf-8')
+        return value
+
+class _Groups(Mapping):
+    """
+    Normalized key -> slice of `values` (memoryview), the snapshot form of
+    ProgrammeIndex.by_name / by_institution / by_cluster. Keys are sorted, so
+    a lookup is a binary search over the string table.
+    """
+
+    def __init__(self, strings, keys, offsets, values):
+        self._strings = strings
+        self._keys = keys
+        self._offsets = offsets
+        self._values = values
+
+    def _find(self, key):
+        lo, hi = 0, len(self._keys)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._strings[self._keys[mid]] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(self._keys) and self._strings[self._keys[lo]] == key:
+            return lo
+        return None
+
+    def __getitem__(self, key):
+        i = self._find(key) if isinstance(key, str) else None
+        if i is None:
+            raise KeyError(key)
+        return self._values[self._offsets[i]:self._offsets[i + 1]]
+
+    def __contains__(self, key):
+        return isinstance(key, str) and self._find(key) is not None
+
+    def __iter__(self):
+        return (self._strings[sid] for sid in self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+class _Codes(Mapping):
+    """Programme code -> position, by binary search over the code-sorted positions."""
+
+    def __init__(self, strings, codes, order):
+        self._strings = strings
+        self._codes = codes
+        self._order = order
+
+    def _code(self, i):
+        return self._strings[self._codes[self._order[i]]] or ''
+
+    def __getitem__(self, code):
+        if isinstance(code, str):
+            lo, hi = 0, len(self._order)
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if self._code(mid) < code:
+                    lo = mid + 1
+                else:
+                    hi = mid
+            if lo < len(self._order) and self._code(lo) == code:
+                return self._order[lo]
+        raise KeyError(code)
+
+    def __iter__(self):
+        return (self._code(i) for i in range(len(self._order)))
+
+    def __len__(self):
+        return len(self._order)
+
+class _Records(Sequence):
+    """Programme dicts, built (once) for the positions that are actually read."""
+
+    def __init__(self, snapshot):
+        self._snapshot = snapshot
+        self._built = [None] * snapshot.count
+
+    def __getitem__(self, pos):
+        rec = self._built[pos]
+        if rec is None:
+            rec = self._built[pos] = self._snapshot.record(pos)
+        return rec
+
+    def __len__(self):
+        return len(self._built)
+
+class _SortKeys(Sequence):
+    """(-cutoff, code) per position, what ProgrammeIndex.seek() bisects."""
+
+    def __init__(self, keys, records):
+        self._keys = keys
+        self._records = records
+
+    def __getitem__(self, pos):
+        return (self._keys[pos], self._records[pos]['code'] or '')
+
+    def __len__(self):
+        return len(self._keys)
+
+class SnapshotIndex(ProgrammeIndex):
+    """
+    ProgrammeIndex served from a memory-mapped snapshot file.
+
+    The arrays ProgrammeIndex keeps as tuples and dicts (cutoffs, bisect keys,
+    lookup tables) are memoryviews into the mapping here, so every inherited
+    query method works unchanged, and opening costs the same for any dataset size.
+    """
+
+    def __init__(self, mapped, header, base):
+        self._mapped = mapped
+        self.version = header['version']
+        self.count = header['count']
+        self.years = tuple(header['years'])
+        view = memoryview(mapped)
+        self._sections = {
+            name: view[base + offset:base + offset + length].cast(typecode)
+            for name, (offset, length, typecode) in header['sections'].items()
+        }
+        s = self._sections
+        self.strings = _Strings(s['string_offsets'], s['string_data'])
+
+        self.records = _Records(self)
+        self.cutoffs = s['latest_cutoff']
+        self._keys = s['sort_key']
+        self._sort_keys = _SortKeys(self._keys, self.records)
+        self.by_code = _Codes(self.strings, s['code'], s['code_order'])
+        for field in GROUP_FIELDS:
+            setattr(self, f'by_{field}', _Groups(self.strings, s[f'{field}_keys'], s[f'{field}_offsets'], s[f'{field}_positions']))
+        self._cluster_keys = _Groups(self.strings, s['cluster_keys'], s['cluster_offsets'], s['cluster_sort_keys'])
+        self._suggest = {}
+
+    @classmethod
+    def open(cls, path, version=None):
+        """
+        Map the snapshot at `path`. Returns None when it is missing, in another
+        format or byte order, or built from a different programmes.db `version`.
+        """
+        try:
+            with open(path, 'rb') as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+        if mapped[:len(MAGIC)] != MAGIC:
+            return None
+        (length,) = struct.unpack_from('<I', mapped, len(MAGIC))
+        base = len(MAGIC) + 4 + length
+        header = json.loads(mapped[len(MAGIC) + 4:base])
+        if header['format'] != FORMAT or header['byteorder'] != sys.byteorder:
+            return None
+        if version is not None and header['version'] != version:
+            return None
+        return cls(mapped, header, base)
+
+    @property
+    def filter_options(self):
+        """The /api/filters lists as compiled into the snapshot (JSON bytes)."""
+        return bytes(self._sections['filters'])
+
+    def record(self, pos):
+        """Build the programme dict for a position (same keys as ProgrammeIndex.from_db)."""
+        s, strings = self._sections, self.strings
+        width = len(self.years)
+        row = s['cutoffs'][pos * width:(pos + 1) * width]
+        # Oldest year first, like the programme_cutoffs primary key order
+        cutoffs = {year: value for year, value in zip(reversed(self.years), reversed(row)) if not math.isnan(value)}
+        history, history_labels = cutoff_history(cutoffs)
+        latest_year = s['latest_year'][pos]
+
+        rec = {
+            'code': strings[s['code'][pos]],
+            'institution': strings[s['institution'][pos]],
+            'name': strings[s['name'][pos]],
+            'cluster': strings[s['cluster'][pos]],
+            'latest_cutoff': s['latest_cutoff'][pos],
+            'latest_year': latest_year if latest_year != NO_YEAR else None,
+            'history': history,
+            'history_labels': history_labels,
+            'trend': strings[s['trend'][pos]],
+            'trend_color': strings[s['trend_color'][pos]],
+        }
+        for field in FLOAT_FIELDS:
+            value = s[field][pos]
+            rec[field] = None if math.isnan(value) else value
+        rec['cutoffs'] = cutoffs
+        return rec
+
+    def __len__(self):
+        return self.count
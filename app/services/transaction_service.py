@@ -0,0 +1,143 @@
+from flask import render_template
+from app.db import get_users_db
+from app.services.events import admin_events
+import base64
+import datetime
+import json
+
+# Admin transaction feed.
+# Pages are keyset-paginated on (created_at, id) so every page is an index range
+# scan, however many transactions exist. Each insert or status change stamps the
+# row with the next `rev` (triggers in migrate_users_db), which is what delta mode
+# (`since=<rev>`) reads to return only new or changed rows.
+
+# LEFT JOIN: with the signed-cookie session backend there is no sessions row
+FEED_SQL = '''
+    SELECT t.*, s.phone
+    FROM transactions t
+    LEFT JOIN sessions s ON t.user_uuid = s.uuid
+'''
+
+def encode_cursor(row):
+    raw = json.dumps([str(row['created_at']), row['id']])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def decode_cursor(token):
+    """Returns (created_at, id) or None for a missing/garbled cursor."""
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        created_at, trx_id = json.loads(raw)
+        return str(created_at), int(trx_id)
+    except (ValueError, TypeError):
+        return None
+
+def latest_rev():
+    db = get_users_db()
+    return db.execute("SELECT COALESCE(MAX(rev), 0) FROM transactions").fetchone()[0]
+
+def list_transactions(before=None, limit=50):
+    """
+    One page of transactions, newest first, strictly older than the `before` cursor.
+    Returns (rows, next_cursor); next_cursor is None on the last page.
+    """
+    db = get_users_db()
+    position = decode_cursor(before)
+    if position:
+        rows = db.execute(FEED_SQL + '''
+            WHERE (t.created_at, t.id) < (?, ?)
+            ORDER BY t.created_at DESC, t.id DESC
+            LIMIT ?
+        ''', (*position, limit + 1)).fetchall()
+    else:
+        rows = db.execute(FEED_SQL + '''
+            ORDER BY t.created_at DESC, t.id DESC
+            LIMIT ?
+        ''', (limit + 1,)).fetchall()
+
+    # The extra row only tells us whether another page exists
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+# Most rows one delta read returns; callers page on the last rev they got
+SINCE_PAGE = 500
+
+def transactions_since(rev, limit=SINCE_PAGE):
+    """Rows inserted or changed after revision `rev`, oldest change first."""
+    db = get_users_db()
+    return db.execute(FEED_SQL + '''
+        WHERE t.rev > ?
+        ORDER BY t.rev
+        LIMIT ?
+    ''', (rev, limit)).fetchall()
+
+def fetch_feed_row(conn, trx_id):
+    """Feed row for one transaction; used inside writer jobs right after a change."""
+    return conn.execute(FEED_SQL + " WHERE t.id = ?", (trx_id,)).fetchone()
+
+def feed_event(row):
+    """Dashboard event payload for a feed row, including its rendered <tr>."""
+    return {
+        'id': row['id'],
+        'rev': row['rev'],
+        'status': row['status'],
+        'html': render_template('admin/transactions_rows.html', transactions=[row], delta=True)
+    }
+
+def publish_change(row):
+    """
+    Push an inserted/changed transaction to connected admin dashboards.
+    The row HTML is rendered once here, not once per subscriber.
+    """
+    if row is None or not len(admin_events):
+        return
+    admin_events.publish('transaction', feed_event(row))
+
+# --- Admin Actions ---
+# action -> (new transaction status, session update applied to the payer)
+TRANSACTION_ACTIONS = {
+    'approve': ('APPROVED', "UPDATE sessions SET tier = 'premium', status = 'PAID', expiry = ? WHERE uuid = ?"),
+    'revoke': ('REVOKED', "UPDATE sessions SET tier = 'basic', status = 'PENDING', expiry = NULL WHERE uuid = ?"),
+    'reject': ('REJECTED', None),
+}
+
+# Stay well under SQLite's bound-parameter limit for IN (...) lists
+_CHUNK = 500
+
+def _chunks(ids):
+    for i in range(0, len(ids), _CHUNK):
+        yield ids[i:i + _CHUNK]
+
+def apply_transaction_action(conn, action, ids):
+    """
+    Apply an admin action to many transactions inside one writer job
+    (one transaction, executemany for both tables).
+    Returns (outcomes, rows): {id: 'ok' | 'not_found'} and the changed feed rows.
+    """
+    status, session_sql = TRANSACTION_ACTIONS[action]
+    ids = list(dict.fromkeys(ids))
+
+    found = {}
+    for chunk in _chunks(ids):
+        placeholders = ','.join('?' * len(chunk))
+        for row in conn.execute(f"SELECT id, user_uuid FROM transactions WHERE id IN ({placeholders})", chunk):
+            found[row['id']] = row['user_uuid']
+
+    conn.executemany("UPDATE transactions SET status = ? WHERE id = ?", [(status, i) for i in found])
+
+    if session_sql:
+        users = set(found.values())
+        if action == 'approve':
+            expiry = datetime.datetime.now() + datetime.timedelta(hours=24)
+            conn.executemany(session_sql, [(expiry, u) for u in users])
+        else:
+            conn.executemany(session_sql, [(u,) for u in users])
+
+    rows = []
+    for chunk in _chunks(list(found)):
+        placeholders = ','.join('?' * len(chunk))
+        rows.extend(conn.execute(FEED_SQL + f" WHERE t.id IN ({placeholders})", chunk))
+
+    outcomes = {i: ('ok' if i in found else 'not_found') for i in ids}
+    return outcomes, rows
@@ -39,11 +39,13 @@ document.addEventListener("DOMContentLoaded", function () {
     let tsCourse, tsUni, tsCluster; // Instances
 
     // --- 1. Fetch Options Async ---
-    fetch('/api/filters')
+    // Versioned URL is immutable, so repeat visits are served from cache
+    const filtersUrl = (typeof DATASET_VERSION !== 'undefined' && DATASET_VERSION)
+        ? `/api/filters?v=${DATASET_VERSION}` : '/api/filters';
+    fetch(filtersUrl)
         .then(response => response.json())
         .then(data => {
             // Transform data for Tom Select (expecting array of objects {value: 'x', text: 'x'})
-            const courses = data.courses.map(x => ({ value: x, text: x }));
             const universities = data.universities.map(x => ({ value: x, text: x }));
             const clusters = data.clusters.map(x => ({ value: x, text: x }));
 
@@ -53,7 +55,36 @@ document.addEventListener("DOMContentLoaded", function () {
                 document.getElementById('select-course').innerHTML = '';
                 tsCourse = new TomSelect("#select-course", {
                     ...singleOptions,
-                    options: courses,
+                    // Course names are fetched as you type instead of shipped with /api/filters
+                    preload: 'focus',
+                    shouldLoad: () => true,
+                    loadThrottle: 150,
+                    load: function (query, callback) {
+                        const params = new URLSearchParams({ field: 'course', q: query });
+                        if (typeof DATASET_VERSION !== 'undefined' && DATASET_VERSION) params.append('v', DATASET_VERSION);
+                        fetch(`/api/suggest?${params.toString()}`)
+                            .then(response => response.json())
+                            .then(data => {
+                                // Only the latest suggestions (the selected course stays)
+                                this.clearOptions();
+                                callback(data.results.map(x => ({ value: x.value, text: x.value, count: x.count })));
+                            })
+                            .catch(() => callback());
+                    },
+                    // Keep the server's ranking
+                    score: () => () => 1,
+                    sortField: [{ field: '$order' }],
+                    // Typed text that isn't a listed course becomes a free-text (ranked) search
+                    create: input => ({ value: input, text: input, freeText: true }),
+                    createOnBlur: true,
+                    render: {
+                        option: function (data, escape) {
+                            const count = data.count > 1 ? ' <span class="text-slate-500 text-xs">(' + data.count + ')</span>' : '';
+                            return '<div class="px-2 py-1 text-slate-300 hover:bg-blue-600 hover:text-white transition">' + escape(data.text) + count + '</div>';
+                        },
+                        option_create: (data, escape) =>
+                            '<div class="create px-2 py-1 text-slate-300">Search for <strong>' + escape(data.input) + '</strong>&hellip;</div>'
+                    },
                     placeholder: "All Courses..."
                 });
             }
@@ -155,8 +186,15 @@ document.addEventListener("DOMContentLoaded", function () {
         }
     }
 
+    // Selected course value, split into an exact title or a free-text query
+    function courseParams() {
+        const value = tsCourse ? tsCourse.getValue() : '';
+        const option = value && tsCourse.options[value];
+        return (option && option.freeText) ? { course: '', q: value } : { course: value, q: '' };
+    }
+
     function performSearch() {
-        const course = tsCourse ? tsCourse.getValue() : '';
+        const { course, q } = courseParams();
         const uni = tsUni ? tsUni.getValue() : [];
         const cluster = tsCluster ? tsCluster.getValue() : [];
         const reach = (document.getElementById('check-reach') && document.getElementById('check-reach').checked) ? 'true' : '';
@@ -181,6 +219,7 @@ document.addEventListener("DOMContentLoaded", function () {
         const params = new URLSearchParams();
 
         if (course) params.append('course', course);
+        if (q) params.append('q', q);
         if (points) params.append('points', points); // Still send main points as fallback/signal
         if (reach) params.append('reach', reach);
 
@@ -207,13 +246,19 @@ document.addEventListener("DOMContentLoaded", function () {
         const newUrl = `${window.location.pathname}?${params.toString()}`;
         window.history.replaceState(null, '', newUrl);
 
-        fetch(`/search?${params.toString()}`, {
+        // Later pages reuse these params; bumping the id drops pages of an older search
+        searchParams = params.toString();
+        const searchId = ++currentSearchId;
+
+        fetch(`/search?${searchParams}`, {
             headers: { 'X-Requested-With': 'XMLHttpRequest' }
         })
             .then(response => response.text())
             .then(html => {
+                if (searchId !== currentSearchId) return;
                 resultsGrid.innerHTML = html;
                 resultsGrid.style.opacity = '1';
+                observeMore();
 
                 // Restore Selections (Persistence)
                 setTimeout(restoreSelections, 50);
@@ -224,6 +269,51 @@ document.addEventListener("DOMContentLoaded", function () {
             });
     }
 
+    // --- Infinite Scroll ---
+    // results_partial.html ends with #results-more (carrying the next cursor)
+    // while more pages exist; when it scrolls into view, fetch and append.
+    let searchParams = new URLSearchParams(window.location.search).toString();
+    let currentSearchId = 0;
+    const moreObserver = ('IntersectionObserver' in window) ? new IntersectionObserver(entries => {
+        entries.forEach(entry => {
+            if (entry.isIntersecting) loadMore(entry.target);
+        });
+    }, { rootMargin: '600px' }) : null;
+
+    function observeMore() {
+        const sentinel = document.getElementById('results-more');
+        if (sentinel && moreObserver) moreObserver.observe(sentinel);
+    }
+
+    function loadMore(sentinel) {
+        if (sentinel.dataset.loading) return;
+        sentinel.dataset.loading = '1';
+        moreObserver.unobserve(sentinel);
+        const searchId = currentSearchId;
+
+        const params = new URLSearchParams(searchParams);
+        params.set('cursor', sentinel.dataset.cursor);
+        fetch(`/search?${params.toString()}`, {
+            headers: { 'X-Requested-With': 'XMLHttpRequest' }
+        })
+            .then(response => response.text())
+            .then(html => {
+                if (searchId !== currentSearchId) return;
+                sentinel.remove();
+                resultsGrid.insertAdjacentHTML('beforeend', html);
+                observeMore();
+                setTimeout(restoreSelections, 50);
+            })
+            .catch(err => {
+                console.error('Loading more results failed', err);
+                delete sentinel.dataset.loading;
+                moreObserver.observe(sentinel);
+            });
+    }
+
+    // Server-rendered first page (full page load)
+    observeMore();
+
     function attachListeners() {
         if (tsCourse) tsCourse.on('change', performSearch);
         if (tsUni) tsUni.on('change', performSearch);
@@ -241,10 +331,20 @@ document.addEventListener("DOMContentLoaded", function () {
         // Restore Course
         const course = params.get('course');
         if (course && tsCourse) {
+            // Suggestions load on demand, so the option may not exist yet
+            tsCourse.addOption({ value: course, text: course });
             tsCourse.setValue(course, true); // true = silent (no event)
             needsSearch = true;
         }
 
+        // Restore Free-Text Query
+        const q = params.get('q');
+        if (q && !course && tsCourse) {
+            tsCourse.addOption({ value: q, text: q, freeText: true });
+            tsCourse.setValue(q, true);
+            needsSearch = true;
+        }
+
         // Restore Unis
         const unis = params.getAll('uni');
         if (unis.length > 0 && tsUni) {
@@ -333,15 +433,27 @@ document.addEventListener("DOMContentLoaded", function () {
             // 1. Check Tier - Removed (Free)
 
             // 2. Gather Filters (Reuse performSearch logic basically)
-            const course = tsCourse ? tsCourse.getValue() : '';
+            const { course } = courseParams();
             const uni = tsUni ? tsUni.getValue() : [];
             const cluster = tsCluster ? tsCluster.getValue() : [];
             const points = inputPoints ? inputPoints.value : '';
+            const reach = (document.getElementById('check-reach') && document.getElementById('check-reach').checked) ? 'true' : '';
+
+            // Dynamic per-cluster points (same as performSearch)
+            const clusterMap = {};
+            if (dynamicContainer && !dynamicContainer.classList.contains('hidden')) {
+                dynamicContainer.querySelectorAll('.dynamic-point-input').forEach(inp => {
+                    if (inp.value) clusterMap[inp.dataset.cluster] = inp.value;
+                });
+            }
 
             // 3. Build URL
             const params = new URLSearchParams();
             if (course) params.append('course', course);
             if (points) params.append('points', points);
+            else if (Object.keys(clusterMap).length > 0) params.append('points', Object.values(clusterMap)[0]);
+            if (reach) params.append('reach', reach);
+            if (Object.keys(clusterMap).length > 0) params.append('cluster_map', JSON.stringify(clusterMap));
 
             if (Array.isArray(uni) && uni.length > 0) uni.forEach(v => params.append('uni', v));
             else if (typeof uni === 'string' && uni) params.append('uni', uni);
@@ -362,13 +474,12 @@ function handleCompare(checkbox) {
     // 0. Premium Check
     // 0. Premium Check - Removed (Free)
 
-    // Parse Course Data
-    let course;
-    if (typeof checkbox.dataset.course === 'string') {
-        course = JSON.parse(checkbox.dataset.course);
-    } else {
-        course = checkbox.dataset.course;
-    }
+    // Only what the tray shows; full data comes from /api/compare when the modal opens
+    const course = {
+        code: checkbox.dataset.code,
+        name: checkbox.dataset.name,
+        institution: checkbox.dataset.inst
+    };
 
     if (checkbox.checked) {
         // Add to Selection
@@ -443,49 +554,88 @@ function updateTrayUI() {
 function openCompareModal() {
     const modal = document.getElementById('modal-compare');
     const container = document.getElementById('compare-container');
+    const yearLabels = document.getElementById('compare-year-labels');
 
     modal.classList.remove('hidden');
     container.innerHTML = ''; // Clear previous
+    if (yearLabels) yearLabels.innerHTML = '';
 
     if (selectedCourses.length === 0) {
         container.innerHTML = '<div class="p-10 text-slate-500 w-full text-center">No courses selected</div>';
         return;
     }
 
-    // Helper to render a column
-    const renderColumn = (c) => {
-        let gapHtml = '';
-        if (c.diff !== undefined) {
-            const color = c.diff >= 0 ? 'text-emerald-400' : 'text-amber-400';
-            const icon = c.diff >= 0 ? '<i class="fa-solid fa-arrow-up"></i>' : '<i class="fa-solid fa-arrow-down"></i>';
-            const sign = c.diff >= 0 ? '+' : '';
-            gapHtml = `<span class="${color} font-mono font-bold text-sm bg-slate-800 px-2 py-1 rounded border border-slate-700">${icon} ${sign}${c.diff.toFixed(2)}</span>`;
-        } else {
-            gapHtml = '<span class="text-slate-500 text-xs">Points not set</span>';
-        }
+    // One batched lookup for every selected code, with the current search's points
+    const current = new URLSearchParams(window.location.search);
+    const params = new URLSearchParams({ codes: selectedCourses.map(c => c.code).join(',') });
+    if (current.get('points')) params.append('points', current.get('points'));
+    if (current.get('cluster_map')) params.append('cluster_map', current.get('cluster_map'));
 
-        let clusterName = c.cluster || '-';
-        const match = clusterName.match(/^(Cluster\s+\d+)/i);
-        if (match) {
-            clusterName = match[1];
-        }
+    container.innerHTML = '<div class="p-10 text-slate-500 w-full text-center"><i class="fa-solid fa-spinner fa-spin"></i></div>';
+    fetch(`/api/compare?${params.toString()}`)
+        .then(response => response.json())
+        .then(data => {
+            container.innerHTML = '';
+            if (yearLabels) {
+                yearLabels.innerHTML = data.years.slice().reverse().map(y =>
+                    `<div class="h-8 flex items-center justify-end pr-2 md:pr-4 text-slate-500 font-mono">${y}</div>`
+                ).join('');
+            }
+            data.programmes.forEach(c => container.appendChild(renderCompareColumn(c, data.years)));
+        })
+        .catch(err => {
+            console.error('Compare failed', err);
+            container.innerHTML = '<div class="p-10 text-slate-500 w-full text-center">Could not load comparison</div>';
+        });
+}
 
-        const div = document.createElement('div');
-        // Fixed Width Column
-        div.className = "w-40 md:w-48 flex-shrink-0 border-r border-slate-700/50 hover:bg-slate-800/50 transition space-y-4 py-4";
-        div.innerHTML = `
-            <div class="h-14 flex items-center justify-center font-bold text-white text-xs md:text-sm leading-tight px-2 text-center break-words overflow-hidden">${c.name}</div>
-            <div class="h-12 flex items-center justify-center text-slate-300 text-[10px] md:text-xs px-2 text-center leading-tight">${c.institution}</div>
-            <div class="h-12 flex items-center justify-center font-mono text-white font-bold text-base md:text-lg border-t border-slate-700/50 bg-slate-900/20">${c.cutoff || 'N/A'}</div>
-            <div class="h-12 flex items-center justify-center border-t border-slate-700/50">${gapHtml}</div>
-            <div class="h-12 flex items-center justify-center text-slate-400 text-[10px] font-bold uppercase tracking-wider border-t border-slate-700/50">${clusterName}</div>
-        `;
-        return div;
-    };
+// One programme column of the compare modal
+function renderCompareColumn(c, years) {
+    let gapHtml = '';
+    if (c.diff !== undefined) {
+        const color = c.diff >= 0 ? 'text-emerald-400' : 'text-amber-400';
+        const icon = c.diff >= 0 ? '<i class="fa-solid fa-arrow-up"></i>' : '<i class="fa-solid fa-arrow-down"></i>';
+        const sign = c.diff >= 0 ? '+' : '';
+        gapHtml = `<span class="${color} font-mono font-bold text-sm bg-slate-800 px-2 py-1 rounded border border-slate-700">${icon} ${sign}${c.diff.toFixed(2)}</span>`;
+    } else {
+        gapHtml = '<span class="text-slate-500 text-xs">Points not set</span>';
+    }
 
-    selectedCourses.forEach(c => {
-        container.appendChild(renderColumn(c));
-    });
+    let clusterName = c.cluster || '-';
+    const match = clusterName.match(/^(Cluster\s+\d+)/i);
+    if (match) {
+        clusterName = match[1];
+    }
+
+    const estimate = (c.forecast !== null && c.forecast !== undefined)
+        ? `${c.forecast} <span class="text-slate-500 text-[10px] font-normal">(${c.forecast_low}&ndash;${c.forecast_high})</span>`
+        : 'N/A';
+
+    // Newest year first, each with its change from the year before
+    const yearRows = years.map((y, i) => {
+        const value = c.series[i];
+        const delta = c.deltas[i];
+        let deltaHtml = '';
+        if (delta !== null) {
+            const color = delta > 0 ? 'text-red-400' : (delta < 0 ? 'text-emerald-400' : 'text-slate-500');
+            deltaHtml = ` <span class="${color} text-[10px]">${delta > 0 ? '+' : ''}${delta.toFixed(2)}</span>`;
+        }
+        return `<div class="h-8 flex items-center justify-center font-mono text-slate-300 text-xs">${value !== null ? value : '&ndash;'}${deltaHtml}</div>`;
+    }).reverse().join('');
+
+    const div = document.createElement('div');
+    // Fixed Width Column
+    div.className = "w-40 md:w-48 flex-shrink-0 border-r border-slate-700/50 hover:bg-slate-800/50 transition space-y-4 py-4";
+    div.innerHTML = `
+        <div class="h-14 flex items-center justify-center font-bold text-white text-xs md:text-sm leading-tight px-2 text-center break-words overflow-hidden">${c.name}</div>
+        <div class="h-12 flex items-center justify-center text-slate-300 text-[10px] md:text-xs px-2 text-center leading-tight">${c.institution}</div>
+        <div class="h-12 flex items-center justify-center font-mono text-white font-bold text-base md:text-lg border-t border-slate-700/50 bg-slate-900/20">${c.cutoff || 'N/A'}</div>
+        <div class="h-12 flex items-center justify-center border-t border-slate-700/50">${gapHtml}</div>
+        <div class="h-12 flex items-center justify-center text-slate-400 text-[10px] font-bold uppercase tracking-wider border-t border-slate-700/50">${clusterName}</div>
+        <div class="h-12 flex items-center justify-center font-mono text-white font-bold text-sm border-t border-slate-700/50">${estimate}</div>
+        <div class="border-t border-slate-700/50">${yearRows}</div>
+    `;
+    return div;
 }
 
 function closeCompareModal() {
@@ -6,14 +6,75 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 # Detect Vercel serverless environment
 IS_VERCEL = os.environ.get('VERCEL', False)
 
+# Local-only fallback; create_app refuses to sign cookie sessions with it outside debug
+DEFAULT_SECRET_KEY = 'dev-key-change-in-prod'
+
 class Config:
-    SECRET_KEY = os.environ.get('SECRET_KEY', 'dev-key-change-in-prod')
+    SECRET_KEY = os.environ.get('SECRET_KEY', DEFAULT_SECRET_KEY)
     PROGRAMMES_DB = os.path.join(BASE_DIR, 'programmes.db')
+    # Read-only programmes.db pool: idle connections kept per worker, mmap window (bytes)
+    PROGRAMMES_POOL_SIZE = int(os.environ.get('PROGRAMMES_POOL_SIZE', 8))
+    PROGRAMMES_MMAP_SIZE = 64 * 1024 * 1024
+    # Compiled catalogue (scripts/build_snapshot.py); used when it matches programmes.db
+    PROGRAMMES_SNAPSHOT = os.path.join(BASE_DIR, 'programmes.snapshot')
     # On Vercel, only /tmp is writable; locally use project root
     USERS_DB = os.path.join('/tmp', 'users.db') if IS_VERCEL else os.path.join(BASE_DIR, 'users.db')
+    # Create/upgrade the users.db schema on a process's first use of it (else run `flask migrate-users-db`)
+    USERS_DB_AUTO_MIGRATE = os.environ.get('USERS_DB_AUTO_MIGRATE', '1') == '1'
+
+    # Route modules (app/routes/<name>.py) registered by create_app
+    BLUEPRINTS = tuple(n.strip() for n in os.environ.get('BLUEPRINTS', 'main,auth,payments,admin').split(',') if n.strip())
+    # Cold start budget (ms) for importing the app and running create_app, checked by tests/test_startup.py
+    # (~180ms measured, almost all of it importing Flask itself)
+    STARTUP_BUDGET_MS = int(os.environ.get('STARTUP_BUDGET_MS', 300))
     
+    # /api/filters caching (seconds) and pre-gzipped payload
+    FILTERS_MAX_AGE = int(os.environ.get('FILTERS_MAX_AGE', 3600))
+    FILTERS_GZIP = True
+
+    # /api/suggest: default and maximum number of matches per call
+    SUGGEST_LIMIT = 20
+    SUGGEST_MAX_LIMIT = 100
+
+    # /search results per page (later pages load on scroll)
+    SEARCH_PAGE_SIZE = 48
+
+    # /api/evaluate: students per call, shortlist length per student (default / max)
+    EVALUATE_MAX_STUDENTS = 10000
+    EVALUATE_LIMIT = 20
+    EVALUATE_MAX_LIMIT = 100
+
+    # /api/compare: programme codes per call
+    COMPARE_MAX_CODES = 50
+
+    # /search result cache: bounded by total cached result rows, entries expire after TTL seconds
+    SEARCH_CACHE_MAX_ROWS = int(os.environ.get('SEARCH_CACHE_MAX_ROWS', 20000))
+    SEARCH_CACHE_TTL = int(os.environ.get('SEARCH_CACHE_TTL', 600))
+
+    # Rendered result-card fragments: one entry per programme, rebuilt per dataset version
+    CARD_CACHE_SIZE = int(os.environ.get('CARD_CACHE_SIZE', 5000))
+    CARD_CACHE_TTL = 24 * 3600
+
+    # Session storage: 'sqlite' (users.db) or 'cookie' (signed, stateless).
+    # Serverless instances default to cookies since their users.db is ephemeral.
+    SESSION_BACKEND = os.environ.get('SESSION_BACKEND', 'cookie' if IS_VERCEL else 'sqlite')
+
+    # Sessions: in-process read-through cache and endpoints that skip session handling
+    SESSION_CACHE_SIZE = int(os.environ.get('SESSION_CACHE_SIZE', 50000))
+    SESSION_CACHE_TTL = int(os.environ.get('SESSION_CACHE_TTL', 60))
+    SESSION_BYPASS_ENDPOINTS = {'static', 'health', 'main.api_filters', 'main.api_suggest', 'main.api_evaluate', 'main.api_search', 'main.api_compare'}
+
+    # users.db single writer: max jobs per group commit, lock wait (ms) for readers/writer
+    USERS_WRITE_BATCH = 500
+    USERS_BUSY_TIMEOUT = 5000
+
     # Admin dashboard access key
     ADMIN_KEY = os.environ.get('ADMIN_KEY', 'admin123')
+    # Transactions per admin feed page, seconds between SSE keepalives
+    ADMIN_PAGE_SIZE = 50
+    ADMIN_STREAM_KEEPALIVE = 15
+    # Max transaction ids per /admin/batch call
+    ADMIN_BATCH_LIMIT = 5000
     
     # M-Pesa Configuration (set via environment variables only)
     MPESA_CONSUMER_KEY = os.environ.get('MPESA_CONSUMER_KEY', '')
@@ -28,3 +89,4 @@ class DevelopmentConfig(Config):
 class ProductionConfig(Config):
     DEBUG = False
     # In production, ensure SECRET_KEY is set in environment
+    # (create_app fails on the default key when SESSION_BACKEND is 'cookie')
@@ -0,0 +1,48 @@
+import argparse
+import sqlite3
+import os
+import sys
+import time
+
+# Ensure we can import config by adding project root to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import Config
+from app.db import get_dataset_version
+from app.services.programme_index import ProgrammeIndex
+from app.services.search_service import filter_options_from_db
+from app.services.snapshot import write_snapshot
+
+def snapshot_path_for(db_path):
+    # programmes.db -> programmes.snapshot, next to it
+    return os.path.splitext(db_path)[0] + '.snapshot'
+
+def build_snapshot(db_path=None, snapshot_path=None):
+    """
+    Compile programmes.db (derived cutoffs, trends, forecasts, lookup tables
+    and the filter lists) into the binary snapshot the app maps at startup.
+    The snapshot records the database's content hash; the app ignores it once
+    programmes.db changes, so re-run this after every import.
+    """
+    db_path = db_path or Config.PROGRAMMES_DB
+    snapshot_path = snapshot_path or snapshot_path_for(db_path)
+    started = time.perf_counter()
+
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    try:
+        index = ProgrammeIndex.from_db(conn)
+        filter_options = filter_options_from_db(conn)
+    finally:
+        conn.close()
+
+    write_snapshot(index, snapshot_path, get_dataset_version(db_path), filter_options)
+    print(f"Snapshot of {len(index)} programmes written to {snapshot_path} "
+          f"({os.path.getsize(snapshot_path)} bytes, {time.perf_counter() - started:.2f}s).")
+    return snapshot_path
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compile programmes.db into the binary catalogue snapshot")
+    parser.add_argument('--db', help="Source database (default: Config.PROGRAMMES_DB)")
+    parser.add_argument('--out', help="Snapshot path (default: next to the database, .snapshot)")
+    args = parser.parse_args()
+    build_snapshot(args.db, args.out)
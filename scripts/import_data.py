@@ -1,11 +1,18 @@
+import argparse
 import csv
+import json
+import re
+import shutil
 import sqlite3
 import os
 import sys
+import time
 
 # Ensure we can import config by adding project root to sys.path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from config import Config
+from app.services.programme_index import CUTOFF_COLUMN, derive
+from scripts.build_snapshot import build_snapshot
 
 def clean_float(value):
     if not value or value.strip() == '-' or value.strip() == '':
@@ -15,73 +22,458 @@ def clean_float(value):
     except ValueError:
         return None
 
-def import_data():
-    csv_path = os.path.join(os.getcwd(), 'degree_programmes_updt2025.csv')
-    db_path = Config.PROGRAMMES_DB
-    
-    print(f"Reading from: {csv_path}")
-    print(f"Writing to: {db_path}")
+def _chunks(items, size=500):
+    # Stay under SQLite's bound-parameter limit for IN (...) lists
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+CUTOFFS_TABLE = '''
+    CREATE TABLE IF NOT EXISTS programme_cutoffs (
+        code TEXT NOT NULL,
+        year INTEGER NOT NULL,
+        cutoff REAL NOT NULL,
+        PRIMARY KEY (code, year)
+    ) WITHOUT ROWID
+'''
+
+def migrate_wide_cutoffs(conn):
+    """
+    Move the cutoff_<year> columns of an older programmes table into
+    programme_cutoffs and drop them. No-op on a current database.
+    """
+    conn.execute(CUTOFFS_TABLE)
+    for col in [r[1] for r in conn.execute('PRAGMA table_info(programmes)')]:
+        m = CUTOFF_COLUMN.match(col)
+        if not m:
+            continue
+        conn.execute(f'''
+            INSERT OR REPLACE INTO programme_cutoffs (code, year, cutoff)
+            SELECT code, {int(m.group(1))}, {col} FROM programmes WHERE {col} IS NOT NULL
+        ''')
+        conn.execute(f'ALTER TABLE programmes DROP COLUMN {col}')
+    conn.commit()
+
+def newest_year(conn):
+    # MAX() on the leading column of idx_programme_cutoffs_year is a single seek
+    return conn.execute('SELECT MAX(year) FROM programme_cutoffs').fetchone()[0]
+
+def materialize_derived(conn, codes=None):
+    """
+    Write the per-programme values search() used to recompute on every request:
+    latest cutoff and its year (the materialized "latest" view of
+    programme_cutoffs), compact history (JSON arrays), the trend label/colour
+    and the next-year forecast (value, band, volatility).
+    Safe to re-run; older databases are moved to programme_cutoffs first.
+    `codes` limits the refresh to those programmes (incremental imports).
+    """
+    migrate_wide_cutoffs(conn)
+    existing = {r[1] for r in conn.execute('PRAGMA table_info(programmes)')}
+    for col, decl in (('latest_cutoff', 'REAL'), ('latest_year', 'INTEGER'), ('history', 'TEXT'),
+                      ('history_labels', 'TEXT'), ('trend', 'TEXT'), ('trend_color', 'TEXT'),
+                      ('forecast', 'REAL'), ('forecast_low', 'REAL'), ('forecast_high', 'REAL'),
+                      ('volatility', 'REAL')):
+        if col not in existing:
+            conn.execute(f'ALTER TABLE programmes ADD COLUMN {col} {decl}')
+
+    # Year-range queries are covered by (year, cutoff, code) and never touch the table;
+    # a programme's history is a range of the (code, year) primary key.
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_programme_cutoffs_year ON programme_cutoffs(year, cutoff, code)')
+    newest = newest_year(conn)
+    forecast_year = newest + 1 if newest else None
+
+    if codes is None:
+        cutoffs = {code: {} for (code,) in conn.execute('SELECT code FROM programmes')}
+        rows = conn.execute('SELECT code, year, cutoff FROM programme_cutoffs')
+    else:
+        cutoffs = {code: {} for code in codes}
+        rows = []
+        for chunk in _chunks(list(codes)):
+            rows.extend(conn.execute(f"SELECT code, year, cutoff FROM programme_cutoffs WHERE code IN ({','.join('?' * len(chunk))})", chunk))
+    for code, year, cutoff in rows:
+        if code in cutoffs:
+            cutoffs[code][year] = cutoff
+
+    updates = []
+    for code, years in cutoffs.items():
+        rec = derive({'code': code, 'cutoffs': years}, forecast_year)
+        updates.append((
+            rec['latest_cutoff'],
+            rec['latest_year'],
+            json.dumps(rec['history']),
+            json.dumps(rec['history_labels']),
+            rec['trend'],
+            rec['trend_color'],
+            rec['forecast'],
+            rec['forecast_low'],
+            rec['forecast_high'],
+            rec['volatility'],
+            rec['code']
+        ))
+    conn.executemany('''
+        UPDATE programmes
+        SET latest_cutoff = ?, latest_year = ?, history = ?, history_labels = ?, trend = ?, trend_color = ?,
+            forecast = ?, forecast_low = ?, forecast_high = ?, volatility = ?
+        WHERE code = ?
+    ''', updates)
+
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_programmes_latest ON programmes(latest_cutoff)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_programmes_cluster_latest ON programmes(cluster, latest_cutoff)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_programmes_institution_latest ON programmes(institution, latest_cutoff)')
+    conn.commit()
+    return len(updates)
+
+def build_search_index(conn, codes=None):
+    """
+    (Re)build the FTS5 free-text index over name, institution and cluster.
+    The trigram tokenizer matches any 3+ character substring, so partial words
+    ("geospatial eng") work; search() falls back to trigram overlap for typos.
+    With `codes`, only those programmes' entries are replaced.
+    """
+    if codes is not None and conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'programmes_fts'").fetchone():
+        for chunk in _chunks(list(codes)):
+            placeholders = ','.join('?' * len(chunk))
+            conn.execute(f"DELETE FROM programmes_fts WHERE code IN ({placeholders})", chunk)
+            conn.execute(f'''
+                INSERT INTO programmes_fts (name, institution, cluster, code)
+                SELECT COALESCE(name, ''), COALESCE(institution, ''), COALESCE(cluster, ''), code
+                FROM programmes WHERE code IN ({placeholders})
+            ''', chunk)
+        conn.commit()
+        return
+
+    conn.execute('DROP TABLE IF EXISTS programmes_fts')
+    conn.execute('''
+        CREATE VIRTUAL TABLE programmes_fts USING fts5(
+            name, institution, cluster, code UNINDEXED,
+            tokenize = 'trigram'
+        )
+    ''')
+    conn.execute('''
+        INSERT INTO programmes_fts (name, institution, cluster, code)
+        SELECT COALESCE(name, ''), COALESCE(institution, ''), COALESCE(cluster, ''), code FROM programmes
+    ''')
+    conn.execute("INSERT INTO programmes_fts (programmes_fts) VALUES ('optimize')")
+    conn.commit()
+
+# --- Import pipeline ---
+# The CSV is loaded into a temporary copy next to programmes.db, validated,
+# indexed and derived there, then swapped in with os.replace(). Serving workers
+# key everything on the file's content hash (app.db.get_dataset_version), so
+# they move to the new file on their next request and never see a partial table.
+
+CSV_COLUMNS = {'code': 'prog_code', 'institution': 'inst_name', 'name': 'prog_name', 'cluster': 'cluster'}
+YEAR_HEADER = re.compile(r'^(\d{4})_cutoff$')
+
+# Source fields stored per programme (derived columns are recomputed from these)
+BASE_COLUMNS = ('code', 'institution', 'name', 'cluster', 'tags')
+
+class ImportReport:
+    """Counts and dirty-row notes collected while loading a CSV."""
+
+    MAX_ISSUES = 20
+
+    def __init__(self):
+        self.rows = 0
+        self.loaded = 0
+        self.issues = []
+        self.issue_count = 0
+        self.added = []
+        self.changed = []
+        self.removed = []
+
+    def issue(self, line, message):
+        self.issue_count += 1
+        if len(self.issues) < self.MAX_ISSUES:
+            self.issues.append(f"line {line}: {message}")
+
+    def print(self, incremental=False):
+        print(f"Read {self.rows} rows, loaded {self.loaded} programmes, {self.issue_count} dirty rows.")
+        for issue in self.issues:
+            print(f"  {issue}")
+        if self.issue_count > len(self.issues):
+            print(f"  ... {self.issue_count - len(self.issues)} more")
+        if incremental:
+            print(f"Changes: {len(self.added)} added, {len(self.changed)} changed, {len(self.removed)} removed.")
+            for label, codes in (('added', self.added), ('changed', self.changed), ('removed', self.removed)):
+                if codes:
+                    print(f"  {label}: {', '.join(codes[:20])}{' ...' if len(codes) > 20 else ''}")
+
+def detect_years(header):
+    """Cutoff years present in the CSV header ('2024_cutoff' -> 2024), newest first."""
+    years = sorted((int(m.group(1)) for m in map(YEAR_HEADER.match, header) if m), reverse=True)
+    if not years:
+        raise ValueError("CSV header has no <year>_cutoff columns")
+    missing = [c for c in CSV_COLUMNS.values() if c not in header]
+    if missing:
+        raise ValueError(f"CSV header is missing: {', '.join(missing)}")
+    return years
+
+def clean_cutoff(value, line, year, report):
+    cleaned = clean_float(value)
+    if cleaned is None and value and value.strip() not in ('', '-'):
+        report.issue(line, f"{year} cutoff {value.strip()!r} is not a number")
+    elif cleaned is not None and not 0 <= cleaned <= 48:
+        report.issue(line, f"{year} cutoff {cleaned} is outside 0-48")
+        cleaned = None
+    return cleaned
 
-    # Connect to database (create if not exists)
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
+def read_programmes(csv_path, report, batch_size=1000):
+    """
+    Stream cleaned programme rows from the CSV in batches.
+    Yields (years, batch); each item is (BASE_COLUMNS row, ((year, cutoff), ...))
+    with only the years that have a cutoff, oldest first.
+    """
+    with open(csv_path, 'r', encoding='utf-8', newline='') as f:
+        reader = csv.reader(f)
+        header = [h.strip() for h in next(reader)]
+        years = detect_years(header)
+        pos = {h: i for i, h in enumerate(header)}
+        year_pos = [pos[f'{year}_cutoff'] for year in years]
 
-    # Create table
-    cursor.execute('DROP TABLE IF EXISTS programmes')
-    cursor.execute('''
+        seen = set()
+        batch = []
+        for line, values in enumerate(reader, start=2):
+            if not any(v.strip() for v in values):
+                continue
+            report.rows += 1
+            if len(values) < len(header):
+                values = values + [''] * (len(header) - len(values))
+
+            code = values[pos[CSV_COLUMNS['code']]].strip()
+            if not code:
+                report.issue(line, "no programme code, skipped")
+                continue
+            if code in seen:
+                report.issue(line, f"duplicate code {code}, kept the first row")
+                continue
+            seen.add(code)
+
+            name = values[pos[CSV_COLUMNS['name']]].strip()
+            institution = values[pos[CSV_COLUMNS['institution']]].strip()
+            if not name or not institution:
+                report.issue(line, f"{code} has no {'name' if not name else 'institution'}")
+
+            # New CSV doesn't carry subject columns, so no tags
+            row = (code, institution, name, values[pos[CSV_COLUMNS['cluster']]].strip(), '')
+            cutoffs = ((year, clean_cutoff(values[i], line, year, report)) for i, year in zip(year_pos, years))
+            batch.append((row, tuple(sorted((year, c) for year, c in cutoffs if c is not None))))
+            report.loaded += 1
+            if len(batch) >= batch_size:
+                yield years, batch
+                batch = []
+        if batch:
+            yield years, batch
+
+def create_schema(conn):
+    # Cutoffs live in programme_cutoffs, so nothing here depends on which years exist
+    conn.execute('''
         CREATE TABLE programmes (
             code TEXT PRIMARY KEY,
             institution TEXT,
             name TEXT,
-            cutoff_2024 REAL,
-            cutoff_2023 REAL,
-            cutoff_2022 REAL,
-            cutoff_2021 REAL,
-            cutoff_2020 REAL,
-            cutoff_2019 REAL,
-            cutoff_2018 REAL,
             cluster TEXT,
-            tags TEXT
+            tags TEXT,
+            latest_cutoff REAL,
+            latest_year INTEGER,
+            history TEXT,
+            history_labels TEXT,
+            trend TEXT,
+            trend_color TEXT,
+            forecast REAL,
+            forecast_low REAL,
+            forecast_high REAL,
+            volatility REAL
         )
     ''')
+    conn.execute(CUTOFFS_TABLE)
+
+INSERT_PROGRAMME = f"INSERT INTO programmes ({', '.join(BASE_COLUMNS)}) VALUES ({', '.join('?' * len(BASE_COLUMNS))})"
+INSERT_CUTOFF = "INSERT INTO programme_cutoffs (code, year, cutoff) VALUES (?, ?, ?)"
+
+def _cutoff_rows(items):
+    return [(row[0], year, cutoff) for row, cutoffs in items for year, cutoff in cutoffs]
+
+def load_full(conn, csv_path, report, batch_size):
+    """Fresh tables from the CSV (executemany per batch)."""
+    created = False
+    for years, batch in read_programmes(csv_path, report, batch_size):
+        if not created:
+            create_schema(conn)
+            created = True
+        conn.executemany(INSERT_PROGRAMME, [row for row, _ in batch])
+        conn.executemany(INSERT_CUTOFF, _cutoff_rows(batch))
+    conn.commit()
+
+def load_incremental(conn, csv_path, report, batch_size):
+    """
+    Upsert only new or changed programmes and delete ones missing from the CSV.
+    Only the years the CSV has columns for are compared and replaced, so a CSV
+    carrying just a new cycle adds its cutoffs and leaves the history alone.
+    Returns the set of codes whose derived data needs refreshing.
+    """
+    incoming = set()
+    touched = set()
+    for years, batch in read_programmes(csv_path, report, batch_size):
+        year_list = ', '.join(str(year) for year in years)
+        current = {}
+        codes = [row[0] for row, _ in batch]
+        for chunk in _chunks(codes):
+            placeholders = ','.join('?' * len(chunk))
+            for row in conn.execute(f"SELECT {', '.join(BASE_COLUMNS)} FROM programmes WHERE code IN ({placeholders})", chunk):
+                current[row[0]] = (tuple(row), [])
+            # (code, year) primary key lookups, no table rows read
+            for code, year, cutoff in conn.execute(f'''
+                SELECT code, year, cutoff FROM programme_cutoffs
+                WHERE code IN ({placeholders}) AND year IN ({year_list})
+                ORDER BY code, year
+            ''', chunk):
+                current[code][1].append((year, cutoff))
 
-    with open(csv_path, 'r', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        
-        count = 0
-        for row in reader:
-            # Map CSV columns to DB columns
-            # CSV Header: prog_code,inst_name,prog_name,2018_cutoff,2019_cutoff,2020_cutoff,2021_cutoff,2022_cutoff,2023_cutoff,2024_cutoff,cluster
-            
-            code = row.get('prog_code')
-            institution = row.get('inst_name')
-            name = row.get('prog_name')
-            
-            # Handle dirty data for cutoffs
-            c24 = clean_float(row.get('2024_cutoff'))
-            c23 = clean_float(row.get('2023_cutoff'))
-            c22 = clean_float(row.get('2022_cutoff'))
-            c21 = clean_float(row.get('2021_cutoff'))
-            c20 = clean_float(row.get('2020_cutoff'))
-            c19 = clean_float(row.get('2019_cutoff'))
-            c18 = clean_float(row.get('2018_cutoff'))
-            
-            cluster = row.get('cluster')
-            
-            # Simple tag derivation
-            subjects = [] # New CSV doesn't seem to have subject_1 columns
-            tags = ",".join(subjects) if subjects else ""
-
-            if code:
-                cursor.execute('''
-                    INSERT OR IGNORE INTO programmes (code, institution, name, cutoff_2024, cutoff_2023, cutoff_2022, cutoff_2021, cutoff_2020, cutoff_2019, cutoff_2018, cluster, tags)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (code, institution, name, c24, c23, c22, c21, c20, c19, c18, cluster, tags))
-                count += 1
+        upserts = []
+        for row, cutoffs in batch:
+            incoming.add(row[0])
+            old = current.get(row[0])
+            if old == (row, list(cutoffs)):
+                continue
+            (report.changed if old else report.added).append(row[0])
+            upserts.append((row, cutoffs))
 
+        if upserts:
+            updates = ', '.join(f'{col} = excluded.{col}' for col in BASE_COLUMNS[1:])
+            conn.executemany(f"{INSERT_PROGRAMME} ON CONFLICT(code) DO UPDATE SET {updates}", [row for row, _ in upserts])
+            conn.executemany(
+                f"DELETE FROM programme_cutoffs WHERE code = ? AND year IN ({year_list})",
+                [(row[0],) for row, _ in upserts]
+            )
+            conn.executemany(INSERT_CUTOFF, _cutoff_rows(upserts))
+            touched.update(row[0] for row, _ in upserts)
+
+    report.removed = sorted(code for (code,) in conn.execute('SELECT code FROM programmes') if code not in incoming)
+    for chunk in _chunks(report.removed):
+        placeholders = ','.join('?' * len(chunk))
+        conn.execute(f"DELETE FROM programmes WHERE code IN ({placeholders})", chunk)
+        conn.execute(f"DELETE FROM programme_cutoffs WHERE code IN ({placeholders})", chunk)
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'programmes_fts'").fetchone():
+            conn.execute(f"DELETE FROM programmes_fts WHERE code IN ({placeholders})", chunk)
     conn.commit()
+    return touched
+
+def validate(conn):
+    """Last checks before the swap; raises ValueError to keep the live file."""
+    if conn.execute('PRAGMA quick_check').fetchone()[0] != 'ok':
+        raise ValueError("quick_check failed on the new database")
+    count = conn.execute('SELECT COUNT(*) FROM programmes').fetchone()[0]
+    if not count:
+        raise ValueError("no programmes loaded")
+    missing = conn.execute('SELECT COUNT(*) FROM programmes WHERE latest_cutoff IS NULL').fetchone()[0]
+    if missing:
+        raise ValueError(f"{missing} programmes have no derived data")
+    return count
+
+def swap_in(tmp_path, db_path):
+    # Readers open programmes.db immutable, so it must be one self-contained file
+    conn = sqlite3.connect(tmp_path)
+    conn.execute('PRAGMA journal_mode = DELETE')
+    # Planner stats, then compact: dropped columns and FTS rebuilds leave free pages
+    # behind, and this file is what gets deployed
+    conn.execute('ANALYZE')
+    conn.commit()
+    conn.execute('VACUUM')
     conn.close()
-    print(f"Successfully imported {count} programmes.")
+    os.replace(tmp_path, db_path)
+
+def import_data(csv_path=None, db_path=None, incremental=False, batch_size=1000):
+    """
+    Load the CSV into a temp copy, validate, build indexes and derived data,
+    then atomically replace programmes.db. Returns the ImportReport.
+    """
+    csv_path = csv_path or os.path.join(os.getcwd(), 'degree_programmes_updt2025.csv')
+    db_path = db_path or Config.PROGRAMMES_DB
+    incremental = incremental and os.path.exists(db_path)
+    started = time.perf_counter()
+
+    print(f"Reading from: {csv_path}")
+    print(f"Writing to: {db_path}{' (incremental)' if incremental else ''}")
+
+    report = ImportReport()
+    tmp_path = f"{db_path}.import-{os.getpid()}"
+    if incremental:
+        shutil.copyfile(db_path, tmp_path)
+    elif os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    try:
+        conn = sqlite3.connect(tmp_path)
+        # Scratch file until the swap: no journal, no fsync per commit
+        conn.execute('PRAGMA journal_mode = OFF')
+        conn.execute('PRAGMA synchronous = OFF')
+
+        if incremental:
+            migrate_wide_cutoffs(conn)
+            before = newest_year(conn)
+            touched = load_incremental(conn, csv_path, report, batch_size)
+            # A new cycle moves every programme's forecast year
+            derive_codes = touched if newest_year(conn) == before else None
+        else:
+            load_full(conn, csv_path, report, batch_size)
+            touched = derive_codes = None
+        report.print(incremental)
+
+        if incremental and not (touched or report.removed):
+            conn.close()
+            os.remove(tmp_path)
+            print(f"No changes; {db_path} left as is ({time.perf_counter() - started:.2f}s).")
+            return report
+
+        materialize_derived(conn, derive_codes)
+        build_search_index(conn, touched)
+        count = validate(conn)
+        conn.commit()
+        conn.close()
+
+        swap_in(tmp_path, db_path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    print(f"Successfully imported {count} programmes in {time.perf_counter() - started:.2f}s.")
+    # The old snapshot no longer matches programmes.db; the app ignores it until this runs
+    build_snapshot(db_path)
+    return report
+
+def derive_only(db_path=None):
+    """Refresh derived columns and the search index without re-reading the CSV (also swapped in atomically)."""
+    db_path = db_path or Config.PROGRAMMES_DB
+    tmp_path = f"{db_path}.import-{os.getpid()}"
+    shutil.copyfile(db_path, tmp_path)
+    try:
+        conn = sqlite3.connect(tmp_path)
+        count = materialize_derived(conn)
+        build_search_index(conn)
+        validate(conn)
+        conn.close()
+        swap_in(tmp_path, db_path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    print(f"Derived columns and search index refreshed for {count} programmes.")
+    build_snapshot(db_path)
 
 if __name__ == '__main__':
-    import_data()
+    parser = argparse.ArgumentParser(description="Import the KUCCPS programmes CSV into programmes.db")
+    parser.add_argument('csv', nargs='?', help="CSV path (default: ./degree_programmes_updt2025.csv)")
+    parser.add_argument('--db', help="Target database (default: Config.PROGRAMMES_DB)")
+    parser.add_argument('--incremental', action='store_true', help="Only upsert changed programmes and report the diff")
+    parser.add_argument('--derive-only', action='store_true', help="Recompute derived columns and the search index")
+    parser.add_argument('--batch-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    if args.derive_only:
+        derive_only(args.db)
+    else:
+        try:
+            import_data(args.csv, args.db, incremental=args.incremental, batch_size=args.batch_size)
+        except ValueError as e:
+            sys.exit(f"Import aborted, {args.db or Config.PROGRAMMES_DB} unchanged: {e}")
@@ -0,0 +1,80 @@
+import argparse
+import json
+import subprocess
+import os
+import sys
+
+# Ensure we can import config by adding project root to sys.path
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+from config import Config
+
+MARKER = '-- cold start --'
+
+# Runs in a fresh interpreter: what a serverless cold start pays before the first request
+COLD_START = '''
+import json, sys, time
+# Everything -X importtime logs before this is interpreter startup (site, .pth files)
+print(MARKER, file=sys.stderr, flush=True)
+started = time.perf_counter()
+from app import create_app
+imported = time.perf_counter()
+create_app()
+done = time.perf_counter()
+print(json.dumps({
+    'import_ms': (imported - started) * 1000,
+    'create_app_ms': (done - imported) * 1000,
+    'total_ms': (done - started) * 1000,
+    'modules': sorted(sys.modules),
+}))
+'''
+
+def parse_importtime(stderr):
+    """`python -X importtime` lines -> [(name, self_us, cumulative_us, depth)] in import order."""
+    imports = []
+    if MARKER in stderr:
+        stderr = stderr.split(MARKER, 1)[1]
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        imports.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return imports
+
+def profile_startup(env=None):
+    """
+    Cold-start report for `from app import create_app; create_app()` in a new
+    interpreter: wall times plus the import-time breakdown.
+    Returns {'total_ms', 'import_ms', 'create_app_ms', 'modules', 'imports'}.
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'MARKER = {MARKER!r}' + COLD_START],
+        cwd=ROOT, env={**os.environ, **(env or {})},
+        capture_output=True, text=True, check=True
+    )
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    report['imports'] = parse_importtime(result.stderr)
+    return report
+
+def top_imports(report, limit=15):
+    """Slowest imports made directly by the app or by its direct imports (cumulative time)."""
+    shallow = [i for i in report['imports'] if i[3] <= 1]
+    return sorted(shallow, key=lambda i: i[2], reverse=True)[:limit]
+
+def print_report(report, budget_ms):
+    print(f"Cold start: {report['total_ms']:.1f}ms "
+          f"(imports {report['import_ms']:.1f}ms, create_app {report['create_app_ms']:.1f}ms), budget {budget_ms}ms")
+    print(f"{'cumulative':>12} {'self':>10}  module")
+    for name, self_us, cumulative_us, depth in top_imports(report):
+        print(f"{cumulative_us / 1000:>10.1f}ms {self_us / 1000:>8.1f}ms  {name}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Profile the app's cold start (imports + create_app)")
+    parser.add_argument('--budget', type=int, default=Config.STARTUP_BUDGET_MS, help="Fail above this many ms")
+    args = parser.parse_args()
+
+    report = profile_startup()
+    print_report(report, args.budget)
+    if report['total_ms'] > args.budget:
+        sys.exit(f"Cold start over budget: {report['total_ms']:.1f}ms > {args.budget}ms")
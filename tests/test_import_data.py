@@ -0,0 +1,111 @@
+import unittest
+import sys
+import os
+import io
+import sqlite3
+import tempfile
+from contextlib import redirect_stdout
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.import_data import import_data
+
+HEADER = 'prog_code,inst_name,prog_name,2018_cutoff,2019_cutoff,2020_cutoff,2021_cutoff,2022_cutoff,2023_cutoff,2024_cutoff,cluster\n'
+ROWS = [
+    '1001,UNIVERSITY A,BACHELOR OF LAWS,40.1,40.5,41.0,41.2,41.9,42.0,42.3,Cluster 1 - Law\n',
+    '1002,UNIVERSITY B,BACHELOR OF ARTS,22.0,-,23.1,,24.0,24.2,24.9,Cluster 3 - Social Sciences\n',
+    '1003,UNIVERSITY A,BACHELOR OF COMMERCE,30.0,31.0,abc,32.0,99,33.5,34.0,Cluster 2 - Business\n',
+]
+
+class TestImportData(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = os.path.join(self.tmp.name, 'programmes.db')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _import(self, rows, **kwargs):
+        path = os.path.join(self.tmp.name, 'programmes.csv')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(HEADER + ''.join(rows))
+        with redirect_stdout(io.StringIO()):
+            return import_data(path, self.db, **kwargs)
+
+    def test_full_then_incremental(self):
+        report = self._import(ROWS)
+        self.assertEqual(report.loaded, 3)
+        # 'abc' is not a number, 99 is off the 0-48 scale
+        self.assertEqual(report.issue_count, 2)
+
+        conn = sqlite3.connect(self.db)
+        self.assertEqual(conn.execute('SELECT COUNT(*) FROM programmes_fts').fetchone()[0], 3)
+        self.assertEqual(conn.execute("SELECT latest_cutoff FROM programmes WHERE code = '1002'").fetchone()[0], 24.9)
+        conn.close()
+
+        changed = ROWS[0].replace('42.3', '43.0')
+        added = '1004,UNIVERSITY C,BACHELOR OF EDUCATION,,,,,,25.0,25.5,Cluster 5 - Education\n'
+        report = self._import([changed, ROWS[1], added], incremental=True)
+        self.assertEqual((report.added, report.changed, report.removed), (['1004'], ['1001'], ['1003']))
+
+        conn = sqlite3.connect(self.db)
+        self.assertEqual(conn.execute("SELECT latest_cutoff FROM programmes WHERE code = '1001'").fetchone()[0], 43.0)
+        # Vacuumed before the swap: no dead pages shipped
+        self.assertEqual(conn.execute('PRAGMA freelist_count').fetchone()[0], 0)
+        self.assertEqual(conn.execute("SELECT code FROM programmes_fts WHERE programmes_fts MATCH 'education'").fetchall(), [('1004',)])
+        conn.close()
+
+        # Nothing changed: the live file is not rewritten
+        stamp = os.stat(self.db).st_mtime_ns
+        self._import([changed, ROWS[1], added], incremental=True)
+        self.assertEqual(os.stat(self.db).st_mtime_ns, stamp)
+
+    def test_new_year_is_just_an_import(self):
+        self._import(ROWS)
+        conn = sqlite3.connect(self.db)
+        forecast = conn.execute("SELECT forecast FROM programmes WHERE code = '1002'").fetchone()[0]
+        conn.close()
+        path = os.path.join(self.tmp.name, 'cycle.csv')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('prog_code,inst_name,prog_name,2025_cutoff,cluster\n')
+            f.write('1001,UNIVERSITY A,BACHELOR OF LAWS,42.8,Cluster 1 - Law\n')
+            f.write('1002,UNIVERSITY B,BACHELOR OF ARTS,,Cluster 3 - Social Sciences\n')
+            f.write('1003,UNIVERSITY A,BACHELOR OF COMMERCE,34.4,Cluster 2 - Business\n')
+        with redirect_stdout(io.StringIO()):
+            report = import_data(path, self.db, incremental=True)
+        self.assertEqual(report.changed, ['1001', '1003'])
+
+        conn = sqlite3.connect(self.db)
+        # Older years stay in programme_cutoffs; 1002 has no 2025 cutoff, so its latest is still 2024
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM programme_cutoffs WHERE code = '1001'").fetchone()[0], 8)
+        self.assertEqual(
+            conn.execute("SELECT code, latest_year, latest_cutoff FROM programmes ORDER BY code").fetchall(),
+            [('1001', 2025, 42.8), ('1002', 2024, 24.9), ('1003', 2025, 34.4)]
+        )
+        history = conn.execute("SELECT history_labels FROM programmes WHERE code = '1001'").fetchone()[0]
+        self.assertEqual(history, '[2018, 2019, 2020, 2021, 2022, 2023, 2024, 2025]')
+        # Forecasts move on to 2026, including the programme the CSV didn't change (rising, so higher)
+        self.assertGreater(conn.execute("SELECT forecast FROM programmes WHERE code = '1002'").fetchone()[0], forecast)
+        plan = ' '.join(r[3] for r in conn.execute("EXPLAIN QUERY PLAN SELECT code, cutoff FROM programme_cutoffs WHERE year BETWEEN 2020 AND 2025 AND cutoff >= 40"))
+        self.assertIn('COVERING INDEX', plan)
+        conn.close()
+
+    def test_failed_import_keeps_live_file(self):
+        self._import(ROWS)
+        with open(self.db, 'rb') as f:
+            before = f.read()
+
+        path = os.path.join(self.tmp.name, 'broken.csv')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('prog_code,inst_name,prog_name,cluster\n1001,A,B,C\n')
+        with redirect_stdout(io.StringIO()), self.assertRaises(ValueError):
+            import_data(path, self.db)
+
+        with open(self.db, 'rb') as f:
+            self.assertEqual(f.read(), before)
+        self.assertEqual(os.listdir(self.tmp.name).count('programmes.db'), 1)
+        self.assertFalse([n for n in os.listdir(self.tmp.name) if '.import-' in n])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -39,7 +39,379 @@ class TestSearchLogic(unittest.TestCase):
         Here, hiding very low courses (e.g. cutoff 15) might be acceptable, 
         but we should ensure we don't hide reasonable options.
         """
-        pass 
+        pass
+
+    def test_cluster_map_window_not_truncated(self):
+        """
+        Dynamic (cluster_map) mode used to apply the points window after LIMIT 100,
+        dropping valid matches. Every result must be inside its own cluster's window,
+        and a low-points cluster must still surface when a high-points one is busy.
+        """
+        from app.services.search_service import get_filter_options
+        clusters = get_filter_options()['clusters']
+        cluster_map = {c: '30' for c in clusters}
+        cluster_map[clusters[0]] = '45'
+
+        results = search(cluster=clusters, user_points='30', cluster_map=cluster_map)
+        self.assertEqual(len(results), 100)
+        for r in results:
+            pts = float(cluster_map[r['cluster']])
+            floor = pts - (10.0 if pts > 40 else 15.0)
+            self.assertTrue(floor <= (r['cutoff'] or 0.0) <= pts, r)
+
+        cutoffs = [r['cutoff'] or 0.0 for r in results]
+        self.assertEqual(cutoffs, sorted(cutoffs, reverse=True))
+
+        # Keys differing in case/spacing select the same window and the same diff/status
+        variant = dict(cluster_map)
+        del variant[clusters[0]]
+        variant[' ' + clusters[0].lower().replace(' ', '  ')] = '45'
+        self.assertTrue(any(r['cluster'] == clusters[0] for r in results))
+        self.assertEqual(search(cluster=clusters, user_points='30', cluster_map=variant), results)
+
+    def test_cached_search_canonical_key(self):
+        """Equivalent queries (list order, points precision) share one cache entry."""
+        from app.services.search_service import cached_search, get_search_cache
+        cache = get_search_cache()
+        cache.clear()
+        unis = ['UNIVERSITY OF NAIROBI', 'MOI UNIVERSITY']
+
+        first = cached_search(institution=unis, user_points='38.5', reach=True)
+        hits = cache.hits
+        second = cached_search(institution=list(reversed(unis)), user_points='38.50001', reach=True)
+        self.assertEqual(cache.hits, hits + 1)
+        self.assertEqual(first, second)
+        self.assertEqual(first, search(institution=unis, user_points='38.5', reach=True))
+
+    def test_free_text_query_ranked(self):
+        """Partial words and typos find a programme without its exact title."""
+        for query in ("geospatial eng", "geospatal enginering"):
+            results = search(query=query, institution=['UNIVERSITY OF NAIROBI'])
+            self.assertTrue(results, query)
+            self.assertEqual(results[0]['name'], 'BACHELOR OF SCIENCE (GEOSPATIAL ENGINEERING)')
+            self.assertTrue(all(r['institution'] == 'UNIVERSITY OF NAIROBI' for r in results))
+
+        # Terms shorter than a trigram can't match anything
+        self.assertEqual(search(query="of"), [])
+
+    def test_filtered_text_query_not_truncated(self):
+        """Uni/cluster filters apply inside the capped FTS query, so no match is lost to the cap."""
+        from app.services.programme_index import get_programme_index, normalize
+        from app.services.search_service import search_page, get_filter_options, _scan_matches
+        index = get_programme_index()
+        cluster = get_filter_options()['clusters'][0]
+        for query, kwargs in (('bachelor', {'institution': ['MOI UNIVERSITY']}),
+                              ('science', {'institution': ['UNIVERSITY OF NAIROBI']}),
+                              ('bachelor', {'cluster': [cluster]})):
+            expected = {
+                index.records[p]['code'] for p in _scan_matches(index, query)
+                if all(normalize(index.records[p][field]) == normalize(values[0])
+                       for field, values in (('institution', kwargs.get('institution')), ('cluster', kwargs.get('cluster'))) if values)
+            }
+            page = search_page(query=query, page_size=10000, with_total=True, **kwargs)
+            self.assertEqual({r['code'] for r in page.results}, expected, (query, kwargs))
+            self.assertEqual(page.total, len(expected))
+
+    def test_keyset_pages_cover_all_matches(self):
+        """Following next_cursor visits every match once, in (cutoff DESC, code) order."""
+        from app.services.programme_index import get_programme_index
+        from app.services.search_service import search_page, _scan_matches
+        first = search_page(user_points='35', reach=True, page_size=40, with_total=True)
+        self.assertGreater(first.total, 100)
+
+        codes, page = [], first
+        while True:
+            codes.extend(r['code'] for r in page.results)
+            if not page.next_cursor:
+                break
+            page = search_page(user_points='35', reach=True, page_size=40, cursor=page.next_cursor)
+
+        self.assertEqual(len(codes), first.total)
+        self.assertEqual(len(set(codes)), len(codes))
+        full = search_page(user_points='35', reach=True, page_size=first.total).results
+        self.assertEqual(codes, [r['code'] for r in full])
+        keys = [(-(r['cutoff'] or 0.0), r['code']) for r in full]
+        self.assertEqual(keys, sorted(keys))
+
+        # Text mode (offset cursor): a filtered free-text query pages through every match too
+        for kwargs in (dict(query='bachelor', institution=['MOI UNIVERSITY']), dict(query='bachelor')):
+            page = first = search_page(page_size=100, with_total=True, **kwargs)
+            codes = []
+            while True:
+                codes.extend(r['code'] for r in page.results)
+                if not page.next_cursor:
+                    break
+                page = search_page(page_size=100, cursor=page.next_cursor, **kwargs)
+            self.assertEqual(len(codes), first.total)
+            self.assertEqual(len(set(codes)), len(codes))
+            self.assertEqual(codes, [r['code'] for r in search_page(page_size=10000, **kwargs).results])
+        self.assertEqual(first.total, len(_scan_matches(get_programme_index(), 'bachelor')))
+
+    def test_batch_evaluation_matches_search(self):
+        """Each student's shortlist is what search() returns; counts cover the whole cluster set."""
+        from app.services.evaluation_service import evaluate_students
+        from app.services.programme_index import get_programme_index
+        from app.services.search_service import get_filter_options
+        clusters = get_filter_options()['clusters']
+        profiles = [
+            {'id': 'a', 'points': 38.5},
+            {'id': 'b', 'points': 30, 'reach': True, 'cluster_map': {clusters[0]: 44}},
+            {'id': 'c', 'points': 25, 'uni': ['UNIVERSITY OF NAIROBI'], 'cluster': clusters[:5]},
+            {'id': 'd'},
+        ]
+        a, b, c, d = evaluate_students(profiles, limit=20)
+
+        # No filters: every programme is classified exactly once
+        self.assertEqual(sum(a['counts'].values()), len(get_programme_index()))
+        for result, kwargs in ((a, dict(user_points='38.5')),
+                               (b, dict(user_points='30', reach=True, cluster_map={clusters[0]: '44'})),
+                               (c, dict(user_points='25', institution=['UNIVERSITY OF NAIROBI'], cluster=clusters[:5]))):
+            expected = search(**kwargs)[:20]
+            self.assertEqual([row[0] for row in result['programmes']], [r['code'] for r in expected])
+            self.assertEqual([row[3] for row in result['programmes']], [r['status'] for r in expected])
+        self.assertIn('error', d)
+
+    def test_forecast_cutoff(self):
+        """A clean linear history extrapolates one year; short histories carry forward."""
+        from app.services.programme_index import forecast_cutoff
+        years = list(range(2020, 2025))
+        forecast, low, high, volatility = forecast_cutoff([30.0, 31.0, 32.0, 33.0, 34.0], years, 2025)
+        self.assertAlmostEqual(forecast, 35.0, places=3)
+        self.assertAlmostEqual(volatility, 0.0, places=3)
+        self.assertTrue(low < forecast < high)
+
+        self.assertEqual(forecast_cutoff([40.0], [2024], 2025)[0], 40.0)
+        self.assertEqual(forecast_cutoff([], [], 2025), (None, None, None, None))
+
+    def test_compare_aligned_series(self):
+        """Batched compare returns programmes in request order on one year axis."""
+        from app.services.compare_service import compare_programmes
+        codes = [r['code'] for r in search(institution=['UNIVERSITY OF NAIROBI'])[:3]]
+        data = compare_programmes(codes + ['NOT-A-CODE', codes[0]], user_points='40')
+
+        self.assertEqual([p['code'] for p in data['programmes']], codes)
+        self.assertEqual(data['missing'], ['NOT-A-CODE'])
+        for p in data['programmes']:
+            self.assertEqual(len(p['series']), len(data['years']))
+            self.assertEqual(len(p['deltas']), len(data['years']))
+            self.assertIn('status', p)
+
+    def test_suggest_prefix(self):
+        """Every query word must prefix a word of the suggestion; counts come along."""
+        from app.services.search_service import suggest
+        results = suggest('course', 'geosp eng')
+        names = [r['value'] for r in results]
+        self.assertIn('BACHELOR OF SCIENCE (GEOSPATIAL ENGINEERING)', names)
+        self.assertTrue(all('GEOSP' in n and 'ENG' in n for n in names))
+
+        unis = suggest('uni', 'univ nairobi', limit=5)
+        self.assertEqual(unis[0]['value'], 'UNIVERSITY OF NAIROBI')
+        self.assertGreater(unis[0]['count'], 1)
+        self.assertEqual(len(suggest('course', '', limit=5)), 5)
+
+    def test_filters_etag_and_gzip(self):
+        """/api/filters: ETag is the dataset version, 304 on a match, gzip when accepted."""
+        import gzip
+        from app.db import get_dataset_version
+        client = self.app.test_client()
+        version = get_dataset_version()
+
+        plain = client.get('/api/filters')
+        self.assertEqual(plain.status_code, 200)
+        self.assertEqual(plain.headers['ETag'], f'"{version}"')
+        self.assertNotIn('Content-Encoding', plain.headers)
+        self.assertIn('Accept-Encoding', plain.headers['Vary'])
+        self.assertTrue(plain.get_json()['clusters'])
+
+        gz = client.get('/api/filters', headers={'Accept-Encoding': 'gzip, deflate'})
+        self.assertEqual(gz.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(gz.data), plain.data)
+        # Each encoding is its own strong representation
+        self.assertEqual(gz.headers['ETag'], f'"{version}-gz"')
+
+        cached = client.get('/api/filters', headers={'If-None-Match': plain.headers['ETag']})
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(cached.data, b'')
+        self.assertIn('Accept-Encoding', cached.headers['Vary'])
+        cached = client.get('/api/filters', headers={'If-None-Match': gz.headers['ETag'], 'Accept-Encoding': 'gzip'})
+        self.assertEqual((cached.status_code, cached.headers['ETag']), (304, gz.headers['ETag']))
+
+        # A validator for one encoding never revalidates the other
+        crossed = client.get('/api/filters', headers={'If-None-Match': plain.headers['ETag'], 'Accept-Encoding': 'gzip'})
+        self.assertEqual(crossed.status_code, 200)
+        self.assertEqual(crossed.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(client.get('/api/filters', headers={'If-None-Match': gz.headers['ETag']}).status_code, 200)
+        self.assertEqual(client.get('/api/filters', headers={'If-None-Match': '"stale"'}).status_code, 200)
+
+        # Versioned URLs are immutable
+        self.assertIn('immutable', client.get('/api/filters', query_string={'v': version}).headers['Cache-Control'])
+
+    def test_api_search_columns(self):
+        """/api/search: field names once, equal-length columns, field selection, clamped limit, cursor paging."""
+        from app.services.search_service import search_page, DEFAULT_SEARCH_FIELDS, SEARCH_LIMIT
+        client = self.app.test_client()
+        args = {'points': '35', 'reach': 'true'}
+
+        data = client.get('/api/search', query_string=args).get_json()
+        self.assertEqual(data['fields'], list(DEFAULT_SEARCH_FIELDS))
+        self.assertEqual(set(data['columns']), set(data['fields']))
+        self.assertEqual({len(values) for values in data['columns'].values()}, {data['count']})
+        self.assertEqual(data['count'], self.app.config['SEARCH_PAGE_SIZE'])
+        self.assertGreater(data['total'], data['count'])
+
+        data = client.get('/api/search', query_string={**args, 'fields': 'code, status,code'}).get_json()
+        self.assertEqual(data['fields'], ['code', 'status'])
+        self.assertEqual(set(data['columns']), {'code', 'status'})
+        self.assertEqual(client.get('/api/search', query_string={**args, 'fields': 'code,secret'}).status_code, 400)
+
+        self.assertEqual(client.get('/api/search', query_string={**args, 'limit': 100000}).get_json()['count'], SEARCH_LIMIT)
+        self.assertEqual(client.get('/api/search', query_string={**args, 'limit': 0}).get_json()['count'], 1)
+
+        first = client.get('/api/search', query_string={**args, 'limit': 20, 'fields': 'code'}).get_json()
+        second = client.get('/api/search', query_string={**args, 'limit': 20, 'fields': 'code', 'cursor': first['next_cursor']}).get_json()
+        expected = search_page(user_points='35', reach=True, page_size=20, cursor=first['next_cursor'])
+        self.assertEqual(second['columns']['code'], [r['code'] for r in expected.results])
+        self.assertEqual(second['next_cursor'], expected.next_cursor)
+        self.assertIsNone(second['total'])
+        self.assertFalse(set(first['columns']['code']) & set(second['columns']['code']))
+
+    def test_export_streams_every_match(self):
+        """/export streams all matches (no 100-row cap) in search order, CSV and JSONL alike."""
+        import csv
+        import io
+        import json
+        from app.services.programme_index import get_programme_index
+        from app.services.search_service import search_page
+        client = self.app.test_client()
+        expected = search_page(user_points='30', reach=True, page_size=10000, with_total=True)
+        self.assertGreater(expected.total, 100)
+        codes = [r['code'] for r in expected.results]
+
+        year = get_programme_index().years[0]
+        response = client.get('/export', query_string={'points': '30', 'reach': 'true', 'columns': f'code,status,cutoff_{year}'})
+        self.assertTrue(response.is_streamed)
+        self.assertEqual(response.mimetype, 'text/csv')
+        rows = list(csv.reader(io.StringIO(response.get_data(as_text=True))))
+        self.assertEqual(rows[0], ['Code', 'Status', f'Cutoff {year}'])
+        self.assertEqual([r[0] for r in rows[1:]], codes)
+        self.assertEqual([r[1] for r in rows[1:]], [r['status'] for r in expected.results])
+
+        response = client.get('/export', query_string={'points': '30', 'reach': 'true', 'format': 'jsonl'})
+        lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        self.assertEqual([line['code'] for line in lines], codes)
+
+        self.assertEqual(client.get('/export', query_string={'points': '30', 'columns': 'code,secret'}).status_code, 400)
+
+    def test_card_fragments_cached_per_dataset_version(self):
+        """Repeat searches reuse rendered cards; a changed programmes.db re-renders them."""
+        import shutil
+        import sqlite3
+        import tempfile
+        from app.services.card_service import get_card_cache
+        from config import DevelopmentConfig
+        with tempfile.TemporaryDirectory() as tmp:
+            class Config(DevelopmentConfig):
+                PROGRAMMES_DB = os.path.join(tmp, 'programmes.db')
+            shutil.copy(DevelopmentConfig.PROGRAMMES_DB, Config.PROGRAMMES_DB)
+            app = create_app(Config)
+            client = app.test_client()
+
+            def render():
+                response = client.get('/search', query_string={'uni': 'UNIVERSITY OF NAIROBI', 'points': '40'},
+                                      headers={'X-Requested-With': 'XMLHttpRequest'})
+                self.assertEqual(response.status_code, 200)
+                return response.get_data(as_text=True)
+
+            with app.app_context():
+                cache = get_card_cache()
+                code = search(institution=['UNIVERSITY OF NAIROBI'], user_points='40')[0]['code']
+
+            first = render()
+            hits, misses = cache.hits, cache.misses
+            self.assertEqual(render(), first)
+            self.assertGreater(cache.hits, hits)
+            self.assertEqual(cache.misses, misses)
+
+            # New dataset version: cached cards are dropped and rebuilt from the new data
+            db = sqlite3.connect(Config.PROGRAMMES_DB)
+            db.execute("UPDATE programmes SET name = 'RENAMED FOR CACHE TEST' WHERE code = ?", (code,))
+            db.commit()
+            db.close()
+            invalidations = cache.invalidations
+            self.assertIn('RENAMED FOR CACHE TEST', render())
+            self.assertEqual(cache.invalidations, invalidations + 1)
+            self.assertNotIn('RENAMED FOR CACHE TEST', first)
+
+    def test_programmes_pool_reuse_and_version_change(self):
+        """Requests reuse pooled connections; a new programmes.db gets a new pool and stale connections close."""
+        import shutil
+        import sqlite3
+        import tempfile
+        from app.db import get_programmes_db, get_programmes_pool
+        from config import DevelopmentConfig
+        with tempfile.TemporaryDirectory() as tmp:
+            class Config(DevelopmentConfig):
+                PROGRAMMES_DB = os.path.join(tmp, 'programmes.db')
+            shutil.copy(DevelopmentConfig.PROGRAMMES_DB, Config.PROGRAMMES_DB)
+            app = create_app(Config)
+
+            with app.app_context():
+                first = get_programmes_db()
+                pool = get_programmes_pool()
+            with app.app_context():
+                self.assertIs(get_programmes_db(), first)
+                self.assertIs(get_programmes_pool(), pool)
+
+            # A request still holding a connection while the dataset changes underneath it
+            held = app.app_context()
+            held.push()
+            stale = get_programmes_db()
+            db = sqlite3.connect(Config.PROGRAMMES_DB)
+            db.execute("UPDATE programmes SET name = name || ' ' WHERE rowid = 1")
+            db.commit()
+            db.close()
+
+            with app.app_context():
+                fresh = get_programmes_pool()
+                self.assertIsNot(fresh, pool)
+                self.assertTrue(pool.closed)
+                self.assertIsNot(get_programmes_db(), stale)
+
+            # Released to the old pool: closed, not handed to the new one
+            held.pop()
+            with self.assertRaises(sqlite3.ProgrammingError):
+                stale.execute("SELECT 1")
+            self.assertNotIn(stale, fresh._idle)
+            with app.app_context():
+                self.assertIsNot(get_programmes_db(), stale)
+            fresh.close()
+
+    def test_snapshot_matches_database(self):
+        """The mmap snapshot answers exactly like the index built from programmes.db."""
+        import tempfile
+        from app.db import get_programmes_db
+        from app.services.programme_index import ProgrammeIndex
+        from app.services.snapshot import SnapshotIndex, write_snapshot
+        db_index = ProgrammeIndex.from_db(get_programmes_db())
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'programmes.snapshot')
+            write_snapshot(db_index, path, 'v1', {'universities': [], 'clusters': []})
+            self.assertIsNone(SnapshotIndex.open(path, 'v2'))
+            snap = SnapshotIndex.open(path, 'v1')
+
+            self.assertEqual(len(snap), len(db_index))
+            for pos in range(0, len(db_index), 97):
+                self.assertEqual(snap.row(pos), db_index.row(pos))
+            code = db_index.records[123]['code']
+            self.assertEqual(snap.by_code[code], 123)
+            key = 'university of nairobi'
+            self.assertEqual(tuple(snap.by_institution[key]), db_index.by_institution[key])
+            for cluster in list(db_index.by_cluster)[:5]:
+                for bounds in ((30.0, 38.0), None):
+                    self.assertEqual(list(snap.window(bounds, cluster)), list(db_index.window(bounds, cluster)))
+                self.assertEqual(snap.status_counts(36.0, cluster), db_index.status_counts(36.0, cluster))
+            rec = db_index.records[500]
+            self.assertEqual(snap.seek(rec['latest_cutoff'], rec['code']), 501)
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,40 @@
+import unittest
+import sys
+import os
+import tempfile
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from app.db import get_users_db, migrate_users_db, USERS_SCHEMA_VERSION
+from config import Config, DevelopmentConfig
+from scripts.profile_startup import profile_startup, print_report
+
+class TestStartup(unittest.TestCase):
+    def test_cold_start_within_budget(self):
+        """A fresh interpreter imports the app and runs create_app() inside STARTUP_BUDGET_MS."""
+        report = profile_startup()
+        if report['total_ms'] > Config.STARTUP_BUDGET_MS:
+            print_report(report, Config.STARTUP_BUDGET_MS)
+        self.assertLessEqual(report['total_ms'], Config.STARTUP_BUDGET_MS)
+        # Only the (disabled) M-Pesa calls need requests
+        self.assertNotIn('requests', report['modules'])
+
+    def test_users_schema_is_a_migration(self):
+        """create_app() leaves users.db alone; first use migrates it once."""
+        with tempfile.TemporaryDirectory() as tmp:
+            class TmpConfig(DevelopmentConfig):
+                USERS_DB = os.path.join(tmp, 'users.db')
+
+            app = create_app(TmpConfig)
+            self.assertFalse(os.path.exists(TmpConfig.USERS_DB))
+
+            with app.app_context():
+                db = get_users_db()
+                self.assertEqual(db.execute("PRAGMA user_version").fetchone()[0], USERS_SCHEMA_VERSION)
+                db.execute("SELECT COUNT(*) FROM transactions").fetchone()
+            self.assertFalse(migrate_users_db(TmpConfig.USERS_DB))
+
+if __name__ == '__main__':
+    unittest.main()
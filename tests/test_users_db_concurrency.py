@@ -0,0 +1,359 @@
+import unittest
+import sys
+import os
+import tempfile
+import threading
+import sqlite3
+import uuid
+import re
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from app.db import get_users_db, get_users_writer, migrate_users_db, UsersDBWriter
+from app.services.transaction_service import SINCE_PAGE
+from app.services.auth_service import create_session, get_session, get_session_backend, get_session_cache, invalidate_session
+from app.services.payment_service import PaymentService
+from config import DevelopmentConfig, ProductionConfig, DEFAULT_SECRET_KEY
+from itsdangerous import URLSafeTimedSerializer
+
+THREADS = 24
+SESSIONS_PER_THREAD = 40
+
+class UsersDBTestCase(unittest.TestCase):
+    # Each test gets its own users.db
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+        class Config(DevelopmentConfig):
+            USERS_DB = os.path.join(self.tmp.name, 'users.db')
+            SESSION_BACKEND = 'sqlite'
+
+        self.app = create_app(Config)
+
+    def tearDown(self):
+        with self.app.app_context():
+            get_users_writer().flush()
+        self.tmp.cleanup()
+
+class TestUsersDBConcurrency(UsersDBTestCase):
+    def _hammer(self, work):
+        errors = []
+
+        def run(n):
+            try:
+                with self.app.app_context():
+                    work(n)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=run, args=(n,)) for n in range(THREADS)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return errors
+
+    def test_concurrent_session_creation(self):
+        """Many threads creating sessions while others read: no 'database is locked'."""
+        created = []
+
+        def work(n):
+            for _ in range(SESSIONS_PER_THREAD):
+                user_uuid = str(uuid.uuid4())
+                create_session(user_uuid)
+                created.append(user_uuid)
+                # Readers run against the same file while the writer commits
+                get_users_db().execute("SELECT COUNT(*) FROM sessions").fetchone()
+                if n % 2:
+                    get_session_backend().update(user_uuid, tier='basic')
+
+        errors = self._hammer(work)
+        self.assertEqual(errors, [])
+
+        with self.app.app_context():
+            self.assertTrue(get_users_writer().flush())
+            db = get_users_db()
+            self.assertEqual(db.execute("PRAGMA journal_mode").fetchone()[0], 'wal')
+            self.assertEqual(db.execute("SELECT COUNT(*) FROM sessions").fetchone()[0], THREADS * SESSIONS_PER_THREAD)
+            # Updates were queued behind their own write-behind inserts
+            basic = db.execute("SELECT COUNT(*) FROM sessions WHERE tier = 'basic'").fetchone()[0]
+            self.assertEqual(basic, (THREADS // 2) * SESSIONS_PER_THREAD)
+            self.assertEqual(get_session(created[0])['uuid'], created[0])
+
+    def test_duplicate_code_race(self):
+        """The same M-Pesa code submitted from every thread is logged exactly once."""
+        outcomes = []
+
+        def work(n):
+            outcomes.append(PaymentService.verify_manual_code(f'user-{n}', 'SBF1234567'))
+
+        errors = self._hammer(work)
+        self.assertEqual(errors, [])
+        self.assertEqual(sum(1 for ok, _ in outcomes if ok), 1)
+
+        with self.app.app_context():
+            count = get_users_db().execute("SELECT COUNT(*) FROM transactions").fetchone()[0]
+            self.assertEqual(count, 1)
+
+    def test_writer_survives_connect_failure(self):
+        """A writer that can't open its file fails the queued jobs, then recovers once it can."""
+        path = os.path.join(self.tmp.name, 'missing', 'users.db')
+        writer = UsersDBWriter(path, busy_timeout=1000)
+        pending = writer.submit("SELECT 1")
+        with self.assertRaises(sqlite3.OperationalError):
+            writer.execute("SELECT 1")
+        self.assertIsInstance(pending.exception(timeout=1), sqlite3.OperationalError)
+
+        os.mkdir(os.path.dirname(path))
+        migrate_users_db(path)
+        self.assertEqual(writer.execute("INSERT INTO transactions (user_uuid, mpesa_code) VALUES ('u', 'QAB0000001')"), 1)
+        self.assertTrue(writer.flush())
+
+class TestSessionLoading(UsersDBTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = self.app.test_client()
+
+    def test_bypassed_endpoints_skip_sessions(self):
+        """Health checks and cacheable APIs set no cookie and never touch users.db."""
+        for url in ('/health', '/api/filters', '/api/suggest?q=law'):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, url)
+            self.assertNotIn('Set-Cookie', response.headers, url)
+        self.assertFalse(os.path.exists(self.app.config['USERS_DB']))
+
+        # A page that needs a session does both
+        self.assertIn('user_id=', self.client.get('/my-session').headers['Set-Cookie'])
+
+    def test_repeat_request_served_from_cache(self):
+        """A returning cookie is answered from the session cache, without reading sessions."""
+        self.client.get('/my-session')
+        user_uuid = self.client.get_cookie('user_id').value
+        with self.app.app_context():
+            get_users_writer().flush()
+            cache = get_session_cache()
+
+        # Changed behind the cache's back: only a SELECT would see it
+        conn = sqlite3.connect(self.app.config['USERS_DB'])
+        conn.execute("UPDATE sessions SET tier = 'premium' WHERE uuid = ?", (user_uuid,))
+        conn.commit()
+        conn.close()
+
+        hits, misses = cache.hits, cache.misses
+        self.assertEqual(self.client.get('/my-session').get_json()['tier'], 'free')
+        self.assertEqual((cache.hits, cache.misses), (hits + 1, misses))
+
+        # Once dropped from the cache, the row is read again
+        with self.app.app_context():
+            invalidate_session(user_uuid)
+        self.assertEqual(self.client.get('/my-session').get_json()['tier'], 'premium')
+        self.assertEqual(cache.misses, misses + 1)
+
+class TestAdminBatch(UsersDBTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = self.app.test_client()
+        self.key = self.app.config['ADMIN_KEY']
+
+        # Two payers with one pending code each
+        self.users = [str(uuid.uuid4()) for _ in range(2)]
+        with self.app.app_context():
+            for n, user_uuid in enumerate(self.users):
+                create_session(user_uuid)
+                ok, _ = PaymentService.verify_manual_code(user_uuid, f'SBF000000{n}')
+                self.assertTrue(ok)
+            get_users_writer().flush()
+            self.ids = [row['id'] for row in get_users_db().execute("SELECT id FROM transactions ORDER BY id")]
+
+    def _batch(self, body):
+        return self.client.post('/admin/batch', query_string={'key': self.key}, json=body)
+
+    def test_batch_outcomes(self):
+        """One outcome per distinct id; the payers' sessions follow the action."""
+        a, b = self.ids
+        response = self._batch({'action': 'approve', 'ids': [a, b, a, 99999]})
+        self.assertEqual(response.status_code, 200)
+        data = response.get_json()
+        self.assertEqual(data['updated'], 2)
+        self.assertEqual(data['results'], [
+            {'id': a, 'outcome': 'ok'}, {'id': b, 'outcome': 'ok'}, {'id': 99999, 'outcome': 'not_found'}
+        ])
+
+        with self.app.app_context():
+            statuses = {r['id']: r['status'] for r in get_users_db().execute("SELECT id, status FROM transactions")}
+            self.assertEqual(statuses, {a: 'APPROVED', b: 'APPROVED'})
+            self.assertEqual([get_session(u)['tier'] for u in self.users], ['premium', 'premium'])
+
+        data = self._batch({'action': 'revoke', 'ids': [a]}).get_json()
+        self.assertEqual(data['results'], [{'id': a, 'outcome': 'ok'}])
+        with self.app.app_context():
+            self.assertEqual([get_session(u)['tier'] for u in self.users], ['basic', 'premium'])
+
+    def test_single_actions_need_admin_key(self):
+        """approve/reject/revoke/batch refuse callers without the admin key and change nothing."""
+        a = self.ids[0]
+        for action in ('approve', 'reject', 'revoke'):
+            self.assertEqual(self.client.post(f'/admin/{action}/{a}').status_code, 403, action)
+            self.assertEqual(self.client.post(f'/admin/{action}/{a}', query_string={'key': 'wrong'}).status_code, 403, action)
+        self.assertEqual(self.client.post('/admin/batch', json={'action': 'approve', 'ids': [a]}).status_code, 403)
+        with self.app.app_context():
+            self.assertEqual(get_users_db().execute("SELECT status FROM transactions WHERE id = ?", (a,)).fetchone()[0], 'PENDING')
+
+        response = self.client.post(f'/admin/approve/{a}', query_string={'key': self.key})
+        self.assertEqual(response.get_json(), {'success': True})
+        with self.app.app_context():
+            self.assertEqual(get_session(self.users[0])['tier'], 'premium')
+
+    def test_batch_rejects_bad_requests(self):
+        """ids must be a list of ints within ADMIN_BATCH_LIMIT; nothing is touched otherwise."""
+        for ids in ('12', [str(self.ids[0])], [1.5], [True], {'1': 1}):
+            response = self._batch({'action': 'approve', 'ids': ids})
+            self.assertEqual(response.status_code, 400, ids)
+        self.assertEqual(self._batch({'action': 'delete', 'ids': self.ids}).status_code, 400)
+
+        self.app.config['ADMIN_BATCH_LIMIT'] = 1
+        response = self._batch({'action': 'approve', 'ids': self.ids})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('At most 1', response.get_json()['message'])
+
+        with self.app.app_context():
+            statuses = [r['status'] for r in get_users_db().execute("SELECT status FROM transactions")]
+            self.assertEqual(statuses, ['PENDING', 'PENDING'])
+
+class TestAdminFeed(UsersDBTestCase):
+    def setUp(self):
+        super().setUp()
+        self.app.config['ADMIN_STREAM_KEEPALIVE'] = 0.05
+        self.client = self.app.test_client()
+        self.key = self.app.config['ADMIN_KEY']
+
+    def _insert(self, count, start=0):
+        with self.app.app_context():
+            get_users_writer().execute(lambda db: db.executemany(
+                "INSERT INTO transactions (user_uuid, mpesa_code, status, amount) VALUES (?, ?, 'PENDING', 50)",
+                [('feed-user', f'QAA{n:07d}') for n in range(start, start + count)]
+            ))
+
+    def test_stream_replays_whole_backlog_once(self):
+        """A client far behind gets every missed rev once, including changes made while it connected."""
+        self._insert(SINCE_PAGE + 20)
+        response = self.client.get('/admin/dashboard/stream', query_string={'key': self.key, 'since': 0}, buffered=False)
+        try:
+            # Subscribed but not yet replayed: this insert is both in the backlog and on the bus
+            with self.app.app_context():
+                ok, _ = PaymentService.verify_manual_code('feed-user', 'SBF7654321')
+            self.assertTrue(ok)
+
+            revs = []
+            for chunk in response.iter_encoded():
+                chunk = chunk.decode()
+                if chunk.startswith(': keepalive'):
+                    break
+                revs.extend(int(line[4:]) for line in chunk.splitlines() if line.startswith('id: '))
+        finally:
+            response.close()
+
+        self.assertEqual(revs, list(range(1, SINCE_PAGE + 22)))
+
+    def _rows(self, **params):
+        response = self.client.get('/admin/dashboard/rows', query_string={'key': self.key, **params})
+        self.assertEqual(response.status_code, 200)
+        return response, [int(i) for i in re.findall(r'id="row-(\d+)"', response.get_data(as_text=True))]
+
+    def test_rows_keyset_pages(self):
+        """Following X-Next-Cursor walks every transaction once, newest first."""
+        self._insert(120)
+        self.app.config['ADMIN_PAGE_SIZE'] = 50
+
+        ids, sizes, cursor = [], [], None
+        while True:
+            response, page = self._rows(**({'before': cursor} if cursor else {}))
+            ids.extend(page)
+            sizes.append(len(page))
+            cursor = response.headers.get('X-Next-Cursor')
+            if not cursor:
+                break
+        self.assertEqual(sizes, [50, 50, 20])
+        self.assertEqual(ids, list(range(120, 0, -1)))
+
+    def test_rows_since_rev(self):
+        """Delta mode returns only rows changed after `since`, and the rev to ask from next."""
+        self._insert(10)
+        response, ids = self._rows(since=0)
+        self.assertEqual(ids, list(range(1, 11)))
+        last_rev = int(response.headers['X-Last-Rev'])
+        self.assertEqual(last_rev, 10)
+
+        # A status change re-stamps the row with the next rev
+        self.client.post('/admin/batch', query_string={'key': self.key}, json={'action': 'reject', 'ids': [3]})
+        self._insert(1, start=10)
+        response, ids = self._rows(since=last_rev)
+        self.assertEqual(ids, [3, 11])
+        self.assertEqual(int(response.headers['X-Last-Rev']), 12)
+
+        response, ids = self._rows(since=12)
+        self.assertEqual((ids, response.headers['X-Last-Rev']), ([], '12'))
+
+class TestCookieSessions(UsersDBTestCase):
+    def setUp(self):
+        super().setUp()
+        self.app.config['SESSION_BACKEND'] = 'cookie'
+        self.client = self.app.test_client()
+
+    def _session(self):
+        # The first visit only issues the cookie; ask again to read it back
+        if self.client.get_cookie('sar_session') is None:
+            self.client.get('/my-session')
+        return self.client.get('/my-session').get_json()
+
+    def test_tampered_cookie_rejected(self):
+        """A cookie not signed with our key is ignored and replaced by a fresh free session."""
+        user = self._session()
+        self.assertEqual(user['tier'], 'free')
+
+        forged = URLSafeTimedSerializer('not-our-key', salt='sar-session').dumps({**user, 'tier': 'premium'})
+        self.client.set_cookie('sar_session', forged)
+        # Treated as no session at all; a new one is issued with the response
+        self.assertEqual(self.client.get('/my-session').get_json(), {'status': 'creating_session'})
+        fresh = self._session()
+        self.assertEqual(fresh['tier'], 'free')
+        self.assertNotEqual(fresh['uuid'], user['uuid'])
+
+        self.client.set_cookie('sar_session', self.client.get_cookie('sar_session').value[:-2] + 'xx')
+        self.assertEqual(self.client.get('/my-session').get_json(), {'status': 'creating_session'})
+
+    def test_legacy_cookie_migrated(self):
+        """A user_id cookie from the sqlite backend keeps its uuid in the signed cookie."""
+        self.client.set_cookie('user_id', 'legacy-uuid')
+        self.assertEqual(self._session()['uuid'], 'legacy-uuid')
+        self.assertIsNotNone(self.client.get_cookie('sar_session'))
+
+        self.client.delete_cookie('user_id')
+        self.assertEqual(self._session()['uuid'], 'legacy-uuid')
+
+    def test_update_resigns_cookie(self):
+        """Changing the session during a request re-signs the cookie with the new fields."""
+        user = self._session()
+        token = self.client.get_cookie('sar_session').value
+
+        self.client.get('/reset-session')
+        self.assertNotEqual(self.client.get_cookie('sar_session').value, token)
+        updated = self._session()
+        self.assertEqual((updated['uuid'], updated['tier'], updated['status']), (user['uuid'], 'basic', 'PENDING'))
+
+    def test_production_needs_secret_key(self):
+        """Production refuses to sign cookie sessions with the default development key."""
+        class Config(ProductionConfig):
+            SESSION_BACKEND = 'cookie'
+            SECRET_KEY = DEFAULT_SECRET_KEY
+
+        with self.assertRaises(RuntimeError):
+            create_app(Config)
+
+        Config.SECRET_KEY = 'a-real-secret'
+        self.assertEqual(create_app(Config).config['SESSION_BACKEND'], 'cookie')
+
+if __name__ == '__main__':
+    unittest.main()